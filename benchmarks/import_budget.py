@@ -0,0 +1,55 @@
+import sys
+import json
+import argparse
+import subprocess
+
+# python -m benchmarks.import_budget [--budget 0.5]
+# checks each import in a fresh interpreter (cold start): wall time under budget and no heavy
+# dependency loaded before it is needed (sklearn/kneed are only needed by the cartoon filter, ffmpeg only for video)
+
+HEAVY_MODULES = ["sklearn", "kneed", "ffmpeg"]
+
+# (import statement, heavy modules that must not be loaded afterwards)
+IMPORT_CHECKS = [
+    ("import mediafilter", HEAVY_MODULES + ["numpy", "cv2"]),
+    ("import mediafilter.filters", HEAVY_MODULES),
+    ("from mediafilter import process_media", HEAVY_MODULES),
+    ("import mediafilter.scheduler", HEAVY_MODULES),
+]
+
+CHILD_CODE = """
+import sys, time, json
+start = time.perf_counter()
+exec({stmt!r})
+print(json.dumps({{"secs": time.perf_counter() - start, "modules": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+# import stmt in a new interpreter, returns (secs, heavy modules that got loaded)
+def time_import(stmt, heavy):
+    out = subprocess.run([sys.executable, "-c", CHILD_CODE.format(stmt=stmt, heavy=heavy)], capture_output=True, text=True, check=True)
+    res = json.loads(out.stdout.strip().splitlines()[-1])
+    return res["secs"], res["modules"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Check cold start import time of the mediafilter package")
+    parser.add_argument("--budget", type=float, default=0.5, help="max seconds allowed for each import")
+    parser.add_argument("--repeats", type=int, default=3, help="imports per check, the fastest one is compared to the budget")
+    args = parser.parse_args()
+
+    failures = 0
+    for stmt, heavy in IMPORT_CHECKS:
+        runs = [time_import(stmt, heavy) for _ in range(args.repeats)]
+        secs = min(secs for secs, _ in runs)
+        loaded = runs[0][1]
+        status = "ok"
+        if secs > args.budget:
+            status = f"OVER BUDGET ({args.budget:.2f} s)"
+        if len(loaded) > 0:
+            status = f"LOADED {', '.join(loaded)}"
+        if status != "ok":
+            failures += 1
+        print(f"{stmt:<45} {secs * 1000:8.1f} ms  {status}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import numpy as np
+import cv2 as cv
+import sklearn
+from mediafilter.constants import *
+import mediafilter.filters as flt
+import mediafilter.filters_utils as fu
+from mediafilter import process_media as pm
+from mediafilter.session import FilterSession
+from benchmarks import synthetic
+
+# python -m benchmarks.run_benchmarks [-o results.json] [--baseline old.json] [--quick]
+
+# time fn() repeats times (after one warm up call), returns stats in seconds
+def time_fn(fn, repeats):
+    times = []
+    for i in range(repeats + 1):
+        np.random.seed(0) # get_k_range samples pixels with np.random (filters use their session's seeded rng)
+        start = time.perf_counter()
+        fn()
+        if i > 0:
+            times.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(times), "min_s": min(times), "repeats": repeats}
+
+def bench_utils(media, results, repeats):
+    for name, path in media.items():
+        if not name.startswith("img_"):
+            continue
+        frame = cv.imread(path)
+        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        pixels = cv.bilateralFilter(frame, BILATERAL_D, BILATERAL_SIGMA_COLOR, BILATERAL_SIGMA_SPACE).reshape(-1, 3)
+        sample = pixels[np.random.default_rng(0).choice(len(pixels), size=min(len(pixels), KMEANS_SAMPLE_SIZE), replace=False)]
+        kmeans = fu.get_kmeans(sample, 12)
+        lut = fu.get_color_lut(kmeans.cluster_centers_)
+        edges = fu.get_edges(gray, SKETCH_BLUR, 50, 100, GAUS_BASE_SIGMA)
+        smoother = fu.EdgeSmoother(EDGE_BUFFER_LEN)
+        k_min, k_max = fu.get_k_range(frame)
+
+        benches = {
+            "normalize_size": lambda: fu.normalize_size(frame),
+            "get_canny_threshs": lambda: fu.get_canny_threshs(gray),
+            "get_sigma": lambda: fu.get_sigma(gray),
+            "get_frame_stats": lambda: fu.get_frame_stats(gray, frame),
+            "get_edges": lambda: fu.get_edges(gray, SKETCH_BLUR, 50, 100, GAUS_BASE_SIGMA),
+            "smooth_edges": lambda: fu.smooth_edges(edges, smoother),
+            "get_k_range": lambda: fu.get_k_range(frame),
+            "get_color_signature": lambda: fu.get_color_signature(frame),
+            "get_k_elbow": lambda: fu.get_k_elbow(sample, k_min, k_max, KMEANS_STEP, for_vid=False),
+            "get_kmeans": lambda: fu.get_kmeans(pixels, 12),
+            "kmeans_predict": lambda: kmeans.predict(pixels),
+            "get_color_lut": lambda: fu.get_color_lut(kmeans.cluster_centers_),
+            "quantize_lut": lambda: fu.quantize_lut(frame, lut),
+        }
+        for fn_name, fn in benches.items():
+            results[f"filters_utils.{fn_name}[{name}]"] = time_fn(fn, repeats)
+
+def bench_filters(media, results, repeats):
+    for name, path in media.items():
+        if not name.startswith("img_"):
+            continue
+        frame = cv.imread(path)
+        results[f"filters.get_sketch_frame[{name}]"] = time_fn(lambda: flt.get_sketch_frame(frame, "White"), repeats)
+        results[f"filters.get_cartoon_frame[{name}]"] = time_fn(lambda: flt.get_cartoon_frame(frame, 0), repeats)
+
+        # video mode on a warm session (palette already fitted)
+        session = FilterSession(VIDEO_BUFFER_POOL_SIZE)
+        flt.get_cartoon_frame(frame, 0, for_video=True, session=session)
+        results[f"filters.get_cartoon_frame_video[{name}]"] = time_fn(lambda: flt.get_cartoon_frame(frame, 1, for_video=True, session=session), repeats)
+        results[f"filters.get_sketch_frame_video[{name}]"] = time_fn(lambda: flt.get_sketch_frame(frame, "White", for_video=True, session=session), repeats)
+
+def bench_end_to_end(media, results, repeats, work_dir):
+    output_dir = os.path.join(work_dir, "out")
+    os.makedirs(output_dir, exist_ok=True)
+    for name, path in media.items():
+        for filter_type, bg_color in [("Sketch", "White"), ("Cartoon", "")]:
+            key = f"process_media.{'process_img' if name.startswith('img_') else 'process_vid'}[{name},{filter_type}]"
+            if name.startswith("img_"):
+                results[key] = time_fn(lambda: pm.process_img(path, output_dir, filter_type, bg_color), repeats)
+            else:
+                results[key] = time_fn(lambda: pm.process_vid(path, output_dir, filter_type, bg_color), max(1, repeats // 3))
+                output_cap = cv.VideoCapture(pm.get_output_path(path, output_dir, filter_type, bg_color))
+                results[key]["fps"] = output_cap.get(cv.CAP_PROP_FRAME_COUNT) / results[key]["median_s"]
+                output_cap.release()
+
+def get_meta():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv.__version__,
+        "sklearn": sklearn.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+# compare min times (least noisy) against baseline, returns list of (name, baseline_s, current_s, ratio) that got slower than threshold
+def get_regressions(results, baseline, threshold):
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = res["min_s"] / base["min_s"]
+        if ratio > 1 + threshold:
+            regressions.append((name, base["min_s"], res["min_s"], ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run_benchmarks")
+    parser.add_argument("-o", "--output", help="write results json here")
+    parser.add_argument("--baseline", help="results json to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="slowdown ratio flagged as regression (0.15 -> 15%% slower)")
+    parser.add_argument("--quick", action="store_true", help="360p only, fewer repeats")
+    parser.add_argument("--repeats", type=int, default=None)
+    parser.add_argument("--only", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--skip-e2e", action="store_true", help="skip process_img/process_vid")
+    args = parser.parse_args(argv)
+
+    repeats = args.repeats or (3 if args.quick else 7)
+    resolutions = ("360p",) if args.quick else ("360p", "720p", "1080p")
+    work_dir = tempfile.mkdtemp(prefix="mf_bench_")
+    results = {}
+    try:
+        media = synthetic.write_media_set(os.path.join(work_dir, "media"), resolutions)
+        bench_utils(media, results, repeats)
+        bench_filters(media, results, repeats)
+        if not args.skip_e2e:
+            bench_end_to_end(media, results, repeats, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.only:
+        results = {name: res for name, res in results.items() if args.only in name}
+
+    for name, res in sorted(results.items()):
+        fps = f"  {res['fps']:.1f} fps" if "fps" in res else ""
+        print(f"{name:<75} {res['median_s'] * 1000:10.2f} ms{fps}")
+
+    report = {"meta": get_meta(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = get_regressions(results, baseline, args.threshold)
+        for name, base_s, curr_s, ratio in regressions:
+            print(f"REGRESSION {name}: {base_s * 1000:.2f} ms -> {curr_s * 1000:.2f} ms ({ratio:.2f}x)")
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
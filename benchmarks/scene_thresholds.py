@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import cv2 as cv
+from benchmarks import synthetic
+import mediafilter.filters as flt
+import mediafilter.filters_utils as fu
+from mediafilter.session import FilterSession
+from mediafilter.metrics import JobReport
+
+# checks the scene signature + palette update thresholds (SCENE_*, PALETTE_DRIFT_THRESH, preset scene_cut_thresh) on synthetic clips:
+# frame to frame signature distances inside a scene vs across cuts, and how many retrains / partial fits each clip triggers
+# python -m benchmarks.scene_thresholds [--size 640x360] [--frames 77] [--preset balanced]
+
+# (name, frames, frame idxs of real cuts)
+def get_clips(w, h, num_frames, tmp_dir):
+    cut_every = num_frames // 3
+    clips = [
+        ("motion", list(synthetic.get_video_frames(w, h, num_frames)), []),
+        ("cuts", list(synthetic.get_video_frames(w, h, num_frames, cut_every=cut_every)), list(range(cut_every, num_frames, cut_every))),
+    ]
+    for kind in ["saturated", "shapes"]: # slow pan, no noise or compression
+        img = synthetic.get_image(kind, w, h)
+        clips.append((f"{kind}_pan", [np.roll(img, frame_idx * 3, axis=1) for frame_idx in range(num_frames)], []))
+    # same cuts clip after an mp4 round trip (compression noise)
+    vid_path = synthetic.write_video(os.path.join(tmp_dir, "cuts.mp4"), w, h, num_frames, cut_every=cut_every)
+    cv_cap = cv.VideoCapture(vid_path)
+    frames = []
+    while True:
+        ret, frame = cv_cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cv_cap.release()
+    clips.append(("cuts_mp4", frames, list(range(cut_every, len(frames), cut_every))))
+    return clips
+
+def get_sig_stats(frames, cut_idxs):
+    sigs = [fu.get_color_signature(frame) for frame in frames]
+    dists = {frame_idx: fu.get_color_dist(sigs[frame_idx], sigs[frame_idx - 1]) for frame_idx in range(1, len(sigs))}
+    within = [d for frame_idx, d in dists.items() if frame_idx not in cut_idxs]
+    across = [d for frame_idx, d in dists.items() if frame_idx in cut_idxs]
+    return {"within_p50": float(np.median(within)), "within_max": float(max(within)), "across_min": float(min(across)) if across else None}
+
+def get_update_counts(frames, preset):
+    report = JobReport()
+    session = FilterSession(2, report, preset)
+    start = time.perf_counter()
+    for frame_idx, frame in enumerate(frames):
+        flt.get_cartoon_frame(frame, frame_idx, for_video=True, session=session)
+    return {"retrains": report.counters.get("retrains", 0), "partial_fits": report.counters.get("partial_fits", 0),
+            "fit_secs": report.stage_secs.get("kmeans_fit", 0.0) + report.stage_secs.get("elbow", 0.0), "secs": time.perf_counter() - start}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.scene_thresholds")
+    parser.add_argument("--size", default="640x360")
+    parser.add_argument("--frames", type=int, default=77)
+    parser.add_argument("-p", "--preset", default="balanced")
+    args = parser.parse_args(argv)
+    w, h = (int(v) for v in args.size.split("x"))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, frames, cut_idxs in get_clips(w, h, args.frames, tmp_dir):
+            stats = get_sig_stats(frames, cut_idxs)
+            counts = get_update_counts(frames, args.preset)
+            across = f"{stats['across_min']:.3f}" if stats["across_min"] is not None else "  -  "
+            print(f"{name:14s} {len(cut_idxs)} cuts | frame dist p50 {stats['within_p50']:.3f} max {stats['within_max']:.3f} cut min {across} | "
+                  f"{counts['retrains']:3d} retrains {counts['partial_fits']:3d} partial fits | fit {counts['fit_secs']:5.1f}s total {counts['secs']:5.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import os
+import numpy as np
+import cv2 as cv
+
+# deterministic synthetic test media (no network needed)
+
+RESOLUTIONS = {"360p": (640, 360), "720p": (1280, 720), "1080p": (1920, 1080)}
+IMAGE_KINDS = ["gradient", "noise", "saturated", "shapes"]
+
+def get_image(kind, w, h, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    if kind == "gradient":
+        img = np.dstack([x / w * 255, y / h * 255, (x + y) / (w + h) * 255])
+    elif kind == "noise":
+        img = rng.normal(128, 40, (h, w, 3))
+    elif kind == "saturated": # strong hue bands, full saturation
+        hsv = np.dstack([(x / w * 180 * 4) % 180, np.full_like(x, 255), 155 + (y / h) * 100])
+        return cv.cvtColor(np.clip(hsv, 0, 255).astype(np.uint8), cv.COLOR_HSV2BGR)
+    else: # flat coloured shapes on a gradient, like a simple cartoon scene
+        img = np.dstack([y / h * 120, np.full_like(x, 90), x / w * 160])
+        img = np.clip(img, 0, 255).astype(np.uint8)
+        for _ in range(12):
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+            cv.circle(img, center, int(rng.integers(h // 20, h // 4)), color, -1)
+        return img
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+# moving shapes over a drifting gradient, with a hard cut to a new scene every cut_every frames
+def get_video_frames(w, h, num_frames, cut_every=None, seed=0):
+    rng = np.random.default_rng(seed)
+    kinds = ["shapes", "gradient", "saturated"]
+    for frame_idx in range(num_frames):
+        scene = frame_idx // cut_every if cut_every else 0
+        frame = np.roll(get_image(kinds[scene % len(kinds)], w, h, seed=seed + scene), frame_idx * 3, axis=1)
+        pos = (int((frame_idx * 7) % w), int(h / 2 + np.sin(frame_idx / 5) * h / 4))
+        cv.circle(frame, pos, h // 8, (0, 0, 255), -1)
+        noise = rng.integers(0, 6, frame.shape, dtype=np.uint8) # sensor noise
+        yield cv.add(frame, noise)
+
+def write_image(path, kind, w, h, seed=0):
+    cv.imwrite(path, get_image(kind, w, h, seed))
+    return path
+
+def write_video(path, w, h, num_frames, fps=30, cut_every=None, seed=0):
+    writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+    for frame in get_video_frames(w, h, num_frames, cut_every, seed):
+        writer.write(frame)
+    writer.release()
+    return path
+
+# writes the standard benchmark media set into out_dir, returns {name: path}
+def write_media_set(out_dir, resolutions=("360p", "720p"), video_frames=48):
+    os.makedirs(out_dir, exist_ok=True)
+    media = {}
+    for res in resolutions:
+        w, h = RESOLUTIONS[res]
+        for kind in IMAGE_KINDS:
+            media[f"img_{kind}_{res}"] = write_image(os.path.join(out_dir, f"{kind}_{res}.png"), kind, w, h)
+        media[f"vid_motion_{res}"] = write_video(os.path.join(out_dir, f"motion_{res}.mp4"), w, h, video_frames)
+        media[f"vid_cuts_{res}"] = write_video(os.path.join(out_dir, f"cuts_{res}.mp4"), w, h, video_frames, cut_every=video_frames // 3)
+    return media
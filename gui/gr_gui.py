@@ -4,22 +4,56 @@ os.environ.setdefault("MKL_NUM_THREADS", "1")
 
 import gradio as gr
 from mediafilter import process_media as pm
-import tempfile
-import random
+from mediafilter.cache import ResultCache
+from mediafilter.scheduler import JobScheduler, SchedulerBusy
+from mediafilter.constants import PRESETS, DEFAULT_PRESET
+from mediafilter import media_pool as mp
 
-from pexelsapi.pexels import Pexels
 PEXELS_KEY = "fIeN1AtM0fclJrWeahHn83w12N9ebHgMqiFjZm0VTQXkrGlAmFI6U3ZG"
-pexel = Pexels(PEXELS_KEY)
-
-# img processing
-def process_image(upload, filter_type, bg_color):
-    output_dir = tempfile.mkdtemp()
-    return pm.process_img(upload, output_dir, filter_type, bg_color)
-
-# vid processing
-def process_video(upload, filter_type, bg_color):
-    output_dir = tempfile.mkdtemp()
-    return pm.process_vid(upload, output_dir, filter_type, bg_color)
+media_provider = mp.PexelsProvider(PEXELS_KEY)
+
+# random media settings
+IMG_SIZE = "large"
+IMG_QUERIES = ["nature", "outdoors", "road", "food"]
+IMG_QUERY_SAMPLE_SIZE = 40
+IMG_MAX_PAGE = 100
+VID_MIN_DUR = 5
+VID_MAX_DUR = 10
+VID_TARGET_RES = 640 * 360
+VID_QUERIES = ["nature", "outdoors", "road", "cars", "food"]
+VID_QUERY_SAMPLE_SIZE = 40
+VID_MAX_PAGE = 30
+
+# filtered pexels results kept ready in the background so the random buttons return immediately
+img_pool = mp.MediaPool(lambda q, page: mp.get_photo_urls(media_provider, q, page, IMG_QUERY_SAMPLE_SIZE, IMG_SIZE), IMG_QUERIES, IMG_MAX_PAGE)
+vid_pool = mp.MediaPool(lambda q, page: mp.get_video_urls(media_provider, q, page, VID_QUERY_SAMPLE_SIZE, VID_MIN_DUR, VID_MAX_DUR, VID_TARGET_RES),
+                        VID_QUERIES, VID_MAX_PAGE)
+
+# outputs are kept in a size capped cache instead of a new temp dir per request
+result_cache = ResultCache()
+scheduler = None # JobScheduler, started with the app (worker processes must not start on import)
+
+# img processing (runs in a scheduler worker process)
+def process_image(upload, filter_type, bg_color, preset):
+    try:
+        future = scheduler.submit(pm.process_img, upload, None, filter_type, bg_color, preset=preset, cache=result_cache)
+    except SchedulerBusy as e:
+        raise gr.Error(str(e))
+    return future.result()
+
+# vid processing (segments are streamed to the preview while processing, full video is shown at the end)
+def process_video(upload, filter_type, bg_color, preset):
+    stream = scheduler.stream_vid(upload, None, filter_type, bg_color, preset=preset, cache=result_cache)
+    while True:
+        try:
+            segment_path = next(stream)
+        except StopIteration as stream_end:
+            vid_output_path = stream_end.value
+            break
+        except SchedulerBusy as e:
+            raise gr.Error(str(e))
+        yield segment_path, gr.skip()
+    yield gr.skip(), vid_output_path
 
 # set bg
 def update_bg_options(filter_choice):
@@ -31,58 +65,17 @@ def update_bg_options(filter_choice):
 
 # get random img from Pexels
 def get_random_img():
-    IMG_SIZE = "large"
-    IMG_QUERIES = ["nature", "outdoors", "road", "food"]
-    IMG_QUERY_SAMPLE_SIZE = 40
-
-    # fetch imgs
-    img_pool = []
-    for q in IMG_QUERIES:
-        rand_page = random.randint(1, 100)
-        res = pexel.search_photos(query=q, per_page=IMG_QUERY_SAMPLE_SIZE, page=rand_page)
-        q_imgs = res.get("photos", [])
-        img_pool.extend(q_imgs)
-
-    if img_pool == None:
+    try:
+        return img_pool.get()
+    except mp.MediaPoolEmpty:
         raise gr.Error("Error fetching images.")
 
-    rand_img = random.choice(img_pool)
-    return rand_img["src"][IMG_SIZE]
-
 # get random vid from Pexels
 def get_random_vid():
-    VID_MIN_DUR = 5
-    VID_MAX_DUR = 10
-    VID_TARGET_RES = 640 * 360
-    VID_QUERIES = ["nature", "outdoors", "road", "cars", "food"]
-    VID_QUERY_SAMPLE_SIZE = 40
-    
-    # fetch vids
-    vid_pool = []
-    for q in VID_QUERIES:
-        rand_page = random.randint(1, 30)
-        res = pexel.search_videos(query=q, per_page=VID_QUERY_SAMPLE_SIZE, page=rand_page)
-        q_vids = res.get("videos")
-        vid_pool += q_vids
-
-    # filter vids by duration
-    filt_by_dur = []
-    for all_vid in vid_pool:
-        if all_vid['duration'] >= VID_MIN_DUR and all_vid['duration'] <= VID_MAX_DUR:
-            filt_by_dur.append(all_vid)
-    vid_pool = filt_by_dur
-
-    # filter vids by res
-    filt_by_res = []
-    for all_vid in vid_pool:
-        for indiv_vid in all_vid["video_files"]:
-            vid_res = indiv_vid["width"] * indiv_vid["height"]
-            if vid_res == VID_TARGET_RES:
-                filt_by_res.append(indiv_vid)
-    vid_pool = filt_by_res
-
-    rand_vid = random.choice(vid_pool)
-    return rand_vid["link"]
+    try:
+        return vid_pool.get()
+    except mp.MediaPoolEmpty:
+        raise gr.Error("Error fetching videos.")
 
 
 # ui
@@ -106,11 +99,12 @@ with gr.Blocks(css=".progress-text {display: none !important;}") as demo:
             img_filter = gr.Radio(["Sketch", "Cartoon"], label="Filter Style")
             img_bg = gr.Radio([], label="Choose Sketch Background Color", value=None, interactive=False, visible=False)
             img_filter.change(update_bg_options, img_filter, img_bg)
+            img_preset = gr.Radio(list(PRESETS), value=DEFAULT_PRESET, label="Speed / Quality")
             
             
             gr.Markdown("### **3. Apply the Filter**")
             img_button = gr.Button("Apply Filter", variant="primary")
-            img_button.click(process_image, [img_input, img_filter, img_bg], img_output)
+            img_button.click(process_image, [img_input, img_filter, img_bg, img_preset], img_output)
 
 
         # vid tab
@@ -121,7 +115,9 @@ with gr.Blocks(css=".progress-text {display: none !important;}") as demo:
                     vid_input = gr.Video(label="Upload Video", width=960, height=540, autoplay=True)
                     random_vid_button = gr.Button("Click For Random Video", variant="primary")
                     gr.Markdown("<u>Note:</u> Randomly generated media is randomly chosen from Pexels.com")
-                vid_output = gr.Video(label="Processed Video", show_download_button=True, width=960, height=540, autoplay=True)
+                with gr.Column():
+                    vid_preview = gr.Video(label="Preview", streaming=True, width=960, height=540, autoplay=True)
+                    vid_output = gr.Video(label="Processed Video", show_download_button=True, width=960, height=540, autoplay=True)
 
             random_vid_button.click(get_random_vid, outputs=vid_input)
             
@@ -129,9 +125,14 @@ with gr.Blocks(css=".progress-text {display: none !important;}") as demo:
             vid_filter = gr.Radio(["Sketch", "Cartoon"], label="Filter Style")
             vid_bg = gr.Radio([], label="Sketch Background Color", value=None, interactive=False, visible=False)
             vid_filter.change(update_bg_options, vid_filter, vid_bg)
+            vid_preset = gr.Radio(list(PRESETS), value=DEFAULT_PRESET, label="Speed / Quality")
             
             gr.Markdown("### **3. Apply the Filter**")
             vid_button = gr.Button("Apply Filter", variant="primary")
-            vid_button.click(process_video, [vid_input, vid_filter, vid_bg], vid_output)
+            vid_button.click(process_video, [vid_input, vid_filter, vid_bg, vid_preset], [vid_preview, vid_output])
 
-demo.launch()
+if __name__ == "__main__":
+    scheduler = JobScheduler()
+    img_pool.refill()
+    vid_pool.refill()
+    demo.launch()
@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import filedialog
 import os
 from mediafilter import process_media as pm
+from mediafilter.constants import PRESETS, DEFAULT_PRESET
 
 class Gui:
     def __init__(self, root):
@@ -12,15 +13,17 @@ class Gui:
         self.video_button = None
         self.sketch_button = None
         self.cartoon_button = None
+        self.preset_buttons = {}
         self.upload_button = None
         self.dload_button = None
         self.condown_button = None
 
         self.upload_path = None
         self.download_dir = None
+        self.preset = DEFAULT_PRESET
 
         root.title("Media Filtering")
-        root.geometry("600x400")
+        root.geometry("600x460")
 
         ### MEDIA ###
         media_frame = tk.Frame(root)
@@ -46,6 +49,18 @@ class Gui:
         self.cartoon_button = tk.Button(filter_frame, text="Cartoon", width=8, command=lambda: self.select_filter(self.cartoon_button))
         self.cartoon_button.pack(side="left", padx=5)
 
+        ### PRESET ###
+        preset_frame = tk.Frame(root)
+        preset_frame.pack(pady=20)
+
+        tk.Label(preset_frame, text="Speed / Quality:", font=("Helvetica", 18, "bold")).pack(side="left", padx=10)
+
+        for preset in PRESETS:
+            preset_button = tk.Button(preset_frame, text=preset.capitalize(), width=8, command=lambda p=preset: self.select_preset(p))
+            preset_button.pack(side="left", padx=5)
+            self.preset_buttons[preset] = preset_button
+        self.select_preset(DEFAULT_PRESET)
+
         ### BOTTOM ###
         bottom_frame = tk.Frame(root)
         bottom_frame.pack(pady=30)
@@ -73,6 +88,12 @@ class Gui:
         choice_button.config(font=("Helvetica", 14, "bold"), fg="green")
         self.filter_type = choice_button.cget("text")
     
+    def select_preset(self, preset):
+        for preset_button in self.preset_buttons.values():
+            preset_button.config(font=("Helvetica", 14), fg="black")
+        self.preset_buttons[preset].config(font=("Helvetica", 14, "bold"), fg="green")
+        self.preset = preset
+
     def choose_upload_path(self):
         file_path = filedialog.askopenfilename(title="Select a Media File", filetypes=[("Images", "*.png *.jpg"), ("Videos", "*.mp4")])
         if file_path:
@@ -92,18 +113,15 @@ class Gui:
         elif (self.media_type == "Image" and input_path_ext == ".mp4") or (self.media_type == "Video" and not input_path_ext == ".mp4"):
             print("Please ensure all selections are valid")
         else:
+            # sketch -> both backgrounds from one pass over the input
+            if self.filter_type == "Sketch":
+                variants = [(self.filter_type, "White"), (self.filter_type, "Black")]
+            else:
+                variants = [(self.filter_type, "")]
             if self.media_type == "Image":
-                if self.filter_type == "Sketch":
-                    pm.process_img(self.upload_path, self.download_dir, self.filter_type, "white")
-                    pm.process_img(self.upload_path, self.download_dir, self.filter_type, "black")
-                else:
-                    pm.process_img(self.upload_path, self.download_dir, self.filter_type, "")
+                pm.process_img_variants(self.upload_path, self.download_dir, variants, preset=self.preset)
             else:
-                if self.filter_type == "Sketch":
-                    pm.process_vid(self.upload_path, self.download_dir, self.filter_type, "white")
-                    pm.process_vid(self.upload_path, self.download_dir, self.filter_type, "black")
-                else:
-                    pm.process_vid(self.upload_path, self.download_dir, self.filter_type, "")
+                pm.process_vid_variants(self.upload_path, self.download_dir, variants, preset=self.preset)
 root = tk.Tk()
 app = Gui(root)
 root.mainloop()
@@ -1,2 +1,20 @@
-from . import filters
-from . import process_media
\ No newline at end of file
+import importlib
+
+# submodules are imported on first access (mediafilter.filters, mediafilter.process_media, ...)
+# so importing the package doesn't load numpy/opencv/sklearn/ffmpeg until they are needed
+LAZY_ATTRS = {
+    "filters": "mediafilter.filters",
+    "process_media": "mediafilter.process_media",
+    "FilterSession": "mediafilter.session",
+}
+
+def __getattr__(name):
+    if name not in LAZY_ATTRS:
+        raise AttributeError(f"module 'mediafilter' has no attribute {name!r}")
+    module = importlib.import_module(LAZY_ATTRS[name])
+    value = module if module.__name__ == f"mediafilter.{name}" else getattr(module, name)
+    globals()[name] = value # cache so __getattr__ only runs once per name
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + list(LAZY_ATTRS))
@@ -0,0 +1,133 @@
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from mediafilter.constants import *
+from mediafilter import process_media as pm
+from mediafilter.metrics import JobReport
+
+# batch filter images/videos: python -m mediafilter INPUTS... -o OUTPUT_DIR -f Sketch|Cartoon
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mediafilter", description="Filter many images and videos in parallel.")
+    parser.add_argument("inputs", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", required=True)
+    parser.add_argument("-f", "--filter", dest="filter_type", choices=["Sketch", "Cartoon"], required=True)
+    parser.add_argument("--bg", dest="bg_color", choices=["Black", "White"], default="Black", help="sketch background color")
+    parser.add_argument("-p", "--preset", choices=list(PRESETS), default=DEFAULT_PRESET, help="speed/quality tier")
+    parser.add_argument("--full-res", action="store_true", help="keep images at their original resolution (processed in tiles)")
+    parser.add_argument("--time-budget", type=float, help="seconds each video should finish in (quality is lowered while filtering if needed)")
+    parser.add_argument("--checkpoint-dir", help="save video progress here after every few seconds of output, rerunning an interrupted job resumes it")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-r", "--recursive", action="store_true", help="also search subdirectories")
+    parser.add_argument("--force", action="store_true", help="reprocess inputs whose output is already up to date")
+    parser.add_argument("--report-dir", help="write a per-stage timing report for each job here")
+    parser.add_argument("--report-format", choices=["json", "prometheus"], default="json")
+    args = parser.parse_args(argv)
+
+    bg_color = args.bg_color if args.filter_type == "Sketch" else ""
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.report_dir:
+        os.makedirs(args.report_dir, exist_ok=True)
+
+    # outputs (and reports) mirror the input tree under output_dir, inputs that would share an output fail up front
+    input_dirs = get_input_paths(args.inputs, args.recursive)
+    output_dirs = {input_path: os.path.normpath(os.path.join(args.output_dir, rel_dir)) for input_path, rel_dir in input_dirs.items()}
+    report_dirs = {input_path: os.path.normpath(os.path.join(args.report_dir, rel_dir)) if args.report_dir else None
+                   for input_path, rel_dir in input_dirs.items()}
+    collided = set()
+    for output_path, input_paths in get_output_collisions(output_dirs, args.filter_type, bg_color).items():
+        print(f"FAILED {', '.join(input_paths)}: would all be written to {output_path}")
+        collided.update(input_paths)
+    jobs = []
+    num_skipped = 0
+    for input_path, output_dir in output_dirs.items():
+        if input_path in collided:
+            continue
+        if not args.force and is_up_to_date(input_path, output_dir, args.filter_type, bg_color):
+            num_skipped += 1
+        else:
+            jobs.append(input_path)
+    print(f"{len(output_dirs)} inputs, {num_skipped} already done, {len(collided)} with clashing outputs, {len(jobs)} to process with {args.workers} workers")
+
+    num_failed = len(collided)
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(run_job, p, output_dirs[p], args.filter_type, bg_color, args.preset, report_dirs[p], args.report_format, args.full_res,
+                               args.time_budget, args.checkpoint_dir): p for p in jobs}
+        for num_done, future in enumerate(as_completed(futures), start=1):
+            input_path = futures[future]
+            elapsed = time.time() - start_time
+            try:
+                output_path, job_secs = future.result()
+                status = f"done {input_path} -> {output_path} in {job_secs:.1f}s"
+            except Exception as e:
+                num_failed += 1
+                status = f"FAILED {input_path}: {e}"
+            print(f"[{num_done}/{len(jobs)}] {status} ({num_done / elapsed:.2f} files/s)")
+
+    num_jobs = len(jobs) + len(collided)
+    print(f"finished {num_jobs - num_failed}/{num_jobs} in {time.time() - start_time:.1f}s, {num_failed} failed, {num_skipped} skipped")
+    return 1 if num_failed else 0
+
+# expand files/directories/globs into {image/video path: its directory relative to the input it was found under}
+# (sorted by path), directory inputs are the root of their files, globs are relative to the part before the first wildcard
+def get_input_paths(inputs, recursive=False):
+    media_exts = IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+    input_dirs = {}
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            root = pattern
+            pattern = os.path.join(pattern, "**", "*") if recursive else os.path.join(pattern, "*")
+        else:
+            root = os.path.dirname(pattern)
+            while glob.has_magic(root):
+                root = os.path.dirname(root)
+        for path in glob.glob(pattern, recursive=recursive):
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in media_exts and path not in input_dirs:
+                input_dirs[path] = os.path.relpath(os.path.dirname(path), root or ".")
+    return dict(sorted(input_dirs.items()))
+
+# {output path: input paths} for outputs more than one input would be written to (e.g. x.png and x.jpg in one dir)
+def get_output_collisions(output_dirs, filter_type, bg_color):
+    output_inputs = {}
+    for input_path, output_dir in output_dirs.items():
+        output_path = os.path.normpath(pm.get_output_path(input_path, output_dir, filter_type, bg_color))
+        output_inputs.setdefault(output_path, []).append(input_path)
+    return {output_path: input_paths for output_path, input_paths in output_inputs.items() if len(input_paths) > 1}
+
+# output exists and is newer than input
+def is_up_to_date(input_path, output_dir, filter_type, bg_color):
+    output_path = pm.get_output_path(input_path, output_dir, filter_type, bg_color)
+    return os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+
+# runs in worker process
+# output is written to a hidden temp dir next to it and moved into place when complete, so an interrupted job never
+# leaves a file that is_up_to_date would take as done
+def run_job(input_path, output_dir, filter_type, bg_color, preset=DEFAULT_PRESET, report_dir=None, report_format="json", full_res=False,
+            time_budget=None, checkpoint_dir=None):
+    start_time = time.time()
+    report = JobReport(job=os.path.basename(input_path), filter=filter_type, preset=preset) if report_dir else None
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=output_dir, prefix=".partial-")
+    try:
+        if os.path.splitext(input_path)[1].lower() in IMAGE_EXTENSIONS:
+            tmp_path = pm.process_img(input_path, tmp_dir, filter_type, bg_color, report=report, preset=preset, full_res=full_res)
+        else:
+            tmp_path = pm.process_vid(input_path, tmp_dir, filter_type, bg_color, report=report, preset=preset, time_budget=time_budget,
+                                      checkpoint_dir=checkpoint_dir)
+        output_path = os.path.join(output_dir, os.path.basename(tmp_path))
+        os.replace(tmp_path, output_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if report is not None:
+        os.makedirs(report_dir, exist_ok=True)
+        report_ext = ".prom" if report_format == "prometheus" else ".json"
+        report.write(os.path.join(report_dir, os.path.splitext(os.path.basename(output_path))[0] + report_ext), report_format)
+    return output_path, time.time() - start_time
+
+if __name__ == "__main__":
+    sys.exit(main())
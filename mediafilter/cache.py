@@ -0,0 +1,81 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import mediafilter.constants as constants
+from mediafilter.constants import *
+
+# filtered results stored by hash of input content + filter settings, least recently used evicted past max_bytes
+class ResultCache:
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), CACHE_DIR_NAME)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # extra_params -> anything else that changes the output (preset, etc)
+    def get_key(self, input_path, filter_type, bg_color="", **extra_params):
+        key_hash = hashlib.sha256()
+        with open(input_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CACHE_HASH_CHUNK), b""):
+                key_hash.update(chunk)
+        key_hash.update(repr((filter_type, bg_color, sorted(extra_params.items()), get_constants_fingerprint())).encode())
+        return key_hash.hexdigest()
+
+    def get_path(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext)
+
+    # cached file path (marked as recently used) or None
+    def get(self, key, ext):
+        path = self.get_path(key, ext)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    # add file to cache (moved if move=True, else copied), returns its cache path
+    def put(self, key, src_path, move=False):
+        path = self.get_path(key, os.path.splitext(src_path)[1])
+        tmp_path = path + f".{os.getpid()}.tmp"
+        if move:
+            shutil.move(src_path, tmp_path)
+        else:
+            shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path) # atomic so readers never see a partial file
+        self.evict(keep_path=path)
+        return path
+
+    # scratch dir for outputs that will be moved into the cache with put(move=True)
+    def make_tmp_dir(self):
+        return tempfile.mkdtemp(dir=self.cache_dir)
+
+    # delete least recently used entries until cache is under max_bytes
+    def evict(self, keep_path=None):
+        entries = []
+        total_bytes = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_bytes += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+# any constant change invalidates cached results
+def get_constants_fingerprint():
+    const_vals = sorted((name, repr(val)) for name, val in vars(constants).items() if name.isupper())
+    return hashlib.sha256(repr(const_vals).encode()).hexdigest()
@@ -14,6 +14,10 @@ GAUS_SIGMA_THRESH_MED = 200
 GAUS_SIGMA_MULT_HIGH = 2.5
 GAUS_SIGMA_MULT_MED = 1.5
 
+# frame statistics (thresholds, sigma, k range)
+STATS_ROW_STEP = 4 # only every nth row is analysed
+STATS_SMOOTHING = 0.3 # weight of current frame when smoothing stats between video frames
+
 # edge detection
 MIN_BLUR_KERNEL = 3
 SKETCH_BLUR = 3
@@ -34,14 +38,40 @@ BILATERAL_SIGMA_SPACE = 75
 
 # kmeans
 KMEANS_SAMPLE_SIZE = 100000 # number of random pixels sampled
-KMEANS_RETRAIN_INTERVAL = 30
+KMEANS_SAMPLE_SEED = 0 # seed of each FilterSession's pixel sampling rng (same input + settings -> same output)
+KMEANS_RETRAIN_INTERVAL = 300 # max frames between retrains when no scene cut is detected
+KMEANS_PARTIAL_FIT_INTERVAL = 30 # max frames between partial fits when palette is stable
 KMEANS_STEP = 2
 KMEANS_BATCH_IMG = 3000 # how many pixels processed per elbow
 KMEANS_BATCH_VID = 2000
 KMEANS_BATCH_FIT = 3000 # number samples processed per mini batch update
+KMEANS_ELBOW_FAST = True # elbow search with warm started lloyd's on a colour histogram instead of a MiniBatchKMeans per k
+KMEANS_ELBOW_HIST_BITS = 5 # histogram cube resolution for fast elbow search
+KMEANS_ELBOW_MAX_ITER = 30
+KMEANS_ELBOW_TOL = 0.5 # stop lloyd's once no centroid moves more than this
 #KMEANS_K_MIN = 10
 #KMEANS_K_MAX = 18
 
+# colour quantization lookup table
+QUANT_USE_LUT = True
+QUANT_LUT_BITS = 5 # 32^3 cube
+QUANT_LUT_CHECK_SIZE = 5000 # pixels compared against exact predict after each retrain
+QUANT_LUT_MAX_ERROR = 2.0 # max mean abs colour difference before falling back to predict
+
+# scene change detection (video palette retraining)
+# thresholds checked with python -m benchmarks.scene_thresholds (640x360 + 1280x720): frame to frame signature distance
+# inside a scene is p50 0.01-0.03 / max 0.04 (slow pans, moving shapes, sensor noise, mp4 compression), drift from
+# the first frame of a scene stays under 0.08, real cuts are 0.80+ -> every preset retrains once per real cut
+# (cuts clip: 4 retrains for 3 cuts, pans: 1 retrain + interval partial fits only)
+SCENE_SIG_SIDE = 160 # frame is downsampled to this before histogramming
+SCENE_HIST_FINE_BINS = 32 # per bgr channel, counted first then spread over the coarse bins (soft binning)
+SCENE_HIST_BINS = 8 # per bgr channel
+SCENE_SIG_SMOOTHING = 0.3 # weight of the current frame in the running (ema) scene signature
+SCENE_CUT_FRAMES = 2 # frames a cut must last, inline fits retrain on the first one and roll back if the old scene returns (flash),
+                     # background (live) fits wait for this many cut frames before retraining
+SCENE_CUT_THRESH = 0.35 # histogram distance from the running signature that counts as a new scene (retrain)
+PALETTE_DRIFT_THRESH = 0.12 # distance between the running signature and the palette's that triggers a partial fit
+
 # cartoon
 DARK_FACTOR = 0.6 # smaller value -> darker edges
 
@@ -57,9 +87,102 @@ FFMPEG_PIX_FMT = "yuv420p" #yuv420p
 FFMPEG_MAXRATE = "24M" #12m
 FFMPEG_BUFSIZE = "48M" #24m
 FFMPEG_TUNE = "animation"
+FFMPEG_STDERR_TAIL_LINES = 20 # last lines of ffmpeg's stderr kept for the error when it fails
 MAX_FPS = 24.0
+VIDEO_DECODER = "opencv" # "opencv" or "ffmpeg" (ffmpeg does fps limiting + resizing before frames reach python)
+PIPELINE_QUEUE_SIZE = 8 # max frames waiting between decode/filter/encode stages
+VIDEO_BUFFER_POOL_SIZE = PIPELINE_QUEUE_SIZE + 2 # reused output frames (queued + being filtered + being written)
+STREAM_SEGMENT_SECS = 2.0 # length of each segment yielded by process_vid_stream
+STREAM_SEGMENT_EXT = ".mp4"
+STREAM_MOVFLAGS = "frag_keyframe+empty_moov+default_base_moof" # fragmented mp4 so segments can be played while streamed
+LIVE_MAX_LATENCY = 0.25 # secs from capture to output before a live frame is dropped instead of filtered
+LIVE_BUFFER_POOL_SIZE = 2 # live frames are written as soon as they are filtered
+LIVE_DEFAULT_FPS = 30.0 # used when a camera/raw stream doesn't report its frame rate
+CHECKPOINT_SEGMENT_SECS = 10.0 # length of each separately encoded piece in checkpointed process_vid (at most this much is redone on resume)
+CHECKPOINT_FILE_NAME = "checkpoint.pkl"
+SEGMENT_MIN_FRAMES = 48 # smallest time segment given to a worker process
+SEGMENT_WARMUP_FRAMES = 8 # frames filtered (not written) before a segment to prime temporal state
+
+# full resolution tiled image mode
+TILE_SIZE = 512 # even so downscaled smoothing lines up between tiles
+TILE_OVERLAP = 16 # extra pixels around each tile, larger than the reach of the bilateral/blur/sobel kernels
+TILE_WORKERS = 4
+
+# incremental cartoon video (presets with "incremental") -> only blocks that changed since they were last filtered are refiltered
+INCREMENTAL_BLOCK_SIZE = 32 # even so downscaled smoothing lines up between blocks
+INCREMENTAL_PIXEL_THRESH = 12 # gray level difference that counts a pixel as changed (above compression noise)
+INCREMENTAL_BLOCK_THRESH = 0.02 # fraction of changed pixels that marks a block as changed
+INCREMENTAL_MARGIN = 16 # extra pixels filtered around changed blocks, larger than the reach of the bilateral/blur/sobel kernels
+INCREMENTAL_MAX_CHANGED = 0.5 # whole frame is refiltered once this fraction of blocks changed
+
+# speed/quality presets, each overrides the constants above for one job ("balanced" keeps them as they are)
+# smooth_scale < 1 -> bilateral filter runs on a downscaled frame which is then upsampled
+# elbow -> k found with an elbow search over the frame's k band in k_step steps (needs 3+ candidates, bands are 4 wide
+#          so k_step <= 2), False -> k is the top of the band without a search
+# fit_on_sample -> palette fitted on the random pixel sample instead of every pixel
+# incremental -> cartoon video frames only refilter changed blocks (full frame on palette updates)
+DEFAULT_PRESET = "balanced"
+PRESETS = {
+    "fast": {
+        "image_max_side": 720, "video_max_side": 480, "smooth_scale": 0.5,
+        "elbow": False, "k_step": KMEANS_STEP, "kmeans_sample_size": 30000, "fit_on_sample": True,
+        "retrain_interval": 600, "partial_fit_interval": 60, "scene_cut_thresh": 0.45, "incremental": True,
+    },
+    "balanced": {
+        "image_max_side": IMAGE_MAX_SIDE, "video_max_side": VIDEO_MAX_SIDE, "smooth_scale": 1.0,
+        "elbow": True, "k_step": KMEANS_STEP, "kmeans_sample_size": KMEANS_SAMPLE_SIZE, "fit_on_sample": False,
+        "retrain_interval": KMEANS_RETRAIN_INTERVAL, "partial_fit_interval": KMEANS_PARTIAL_FIT_INTERVAL, "scene_cut_thresh": SCENE_CUT_THRESH,
+        "incremental": False,
+    },
+    "quality": {
+        "image_max_side": 1280, "video_max_side": 960, "smooth_scale": 1.0,
+        "elbow": True, "k_step": 1, "kmeans_sample_size": KMEANS_SAMPLE_SIZE, "fit_on_sample": False,
+        "retrain_interval": 150, "partial_fit_interval": 15, "scene_cut_thresh": 0.3, "incremental": False,
+    },
+}
+
+# deadline controller (process_vid time_budget), quality levels from best to fastest
+# scale -> frames are filtered at this fraction of the working resolution then upscaled
+# frame_step -> only every nth frame is filtered, the others repeat it (lower effective fps cap)
+# palette_mult -> multiplies the preset's retrain + partial fit intervals
+# elbow -> False skips the elbow search (fixed k, see PRESETS)
+DEADLINE_LEVELS = [
+    {"scale": 1.0, "frame_step": 1, "palette_mult": 1, "elbow": True},
+    {"scale": 1.0, "frame_step": 1, "palette_mult": 2, "elbow": False},
+    {"scale": 0.75, "frame_step": 1, "palette_mult": 2, "elbow": False},
+    {"scale": 0.75, "frame_step": 2, "palette_mult": 4, "elbow": False},
+    {"scale": 0.5, "frame_step": 2, "palette_mult": 4, "elbow": False},
+    {"scale": 0.5, "frame_step": 3, "palette_mult": 8, "elbow": False},
+]
+DEADLINE_CHECK_FRAMES = 12 # frames between throughput checks
+DEADLINE_TARGET = 0.9 # remaining frames should be projected to take at most this fraction of the time left
+DEADLINE_RELAX = 0.6 # go back up a level once it is projected to need less than this fraction of the time left
+DEADLINE_SMOOTHING = 0.5 # weight of the latest check when averaging a level's secs per frame
+
+# job scheduler (gradio app)
+SCHED_LIGHT_WORKERS = 2 # images + short clips
+SCHED_HEAVY_WORKERS = 1 # long videos
+SCHED_HEAVY_COST = 40 # jobs with at least this estimated cost go to the heavy lane
+SCHED_LIGHT_MAX_QUEUED_COST = 200 # new jobs are rejected while this much work is queued/running in the lane
+SCHED_HEAVY_MAX_QUEUED_COST = 2000
+SCHED_FILTER_WEIGHTS = {"Sketch": 1.0, "Cartoon": 10.0} # relative cost per video megapixel-frame
+SCHED_IMAGE_WEIGHTS = {"Sketch": 1.0, "Cartoon": 30.0} # images fit the palette on every pixel
+SCHED_PRESET_WEIGHTS = {"fast": 0.4, "balanced": 1.0, "quality": 1.5}
+WARM_FRAME_SIDE = 64 # frame filtered once by each new worker
+
+# random media pool (gradio "random image/video" buttons)
+MEDIA_POOL_SIZE = 200 # max urls kept ready
+MEDIA_POOL_REFILL_AT = 40 # fetch more search pages once the pool is this small
+MEDIA_POOL_FETCHERS = 5 # concurrent search requests
+MEDIA_POOL_WAIT_SECS = 15 # max wait when the pool is empty
+
+# result cache
+CACHE_DIR_NAME = "mediafilter_cache" # created in the system temp dir
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+CACHE_HASH_CHUNK = 1024 * 1024
 
 # file exts
 IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]
+VIDEO_EXTENSIONS = [".mp4", ".mov", ".avi", ".mkv", ".webm"]
 OUTPUT_IMAGE_EXT = ".png"
 OUTPUT_VIDEO_EXT = ".mp4"
\ No newline at end of file
@@ -0,0 +1,112 @@
+import time
+import cv2 as cv
+from mediafilter.constants import *
+from mediafilter.metrics import count
+
+# adjusts a video job's quality while it runs so it finishes within budget_secs
+# every check_frames frames the remaining frames are projected at the current level's measured speed, dropping one
+# DEADLINE_LEVELS step when they won't fit in the time left and going back up when the better level fits again
+# total_frames -> expected number of output frames, session.preset is replaced by a copy whose knobs get changed
+class DeadlineController:
+    def __init__(self, budget_secs, total_frames, session, levels=DEADLINE_LEVELS, check_frames=DEADLINE_CHECK_FRAMES):
+        self.budget_secs = budget_secs
+        self.total_frames = total_frames
+        self.session = session
+        self.levels = levels
+        self.check_frames = check_frames
+        self.base_preset = session.preset
+        session.preset = dict(session.preset)
+        self.level_idx = 0
+        self.level_secs = {} # level idx -> smoothed secs per frame (decode + filter + encode)
+        self.level_frames = [0] * len(levels)
+        self.changes = [] # (frame number, old level idx, new level idx)
+        self.num_frames = 0
+        self.last_output = None
+        self.start_time = time.perf_counter()
+        self.window_start = self.start_time
+        self.window_frames = 0
+        self.apply_level()
+
+    # filter_fn(frame) -> filtered frame, run at the current level's resolution (or skipped)
+    def filter_frame(self, frame, filter_fn):
+        if self.window_frames >= self.check_frames:
+            self.update()
+        level = self.levels[self.level_idx]
+        if self.last_output is not None and self.num_frames % level["frame_step"] != 0:
+            output = self.last_output
+            count(self.session.report, "deadline_repeated_frames")
+        elif level["scale"] < 1:
+            h, w = frame.shape[:2]
+            small = cv.resize(frame, (max(2, int(w * level["scale"])), max(2, int(h * level["scale"]))), interpolation=cv.INTER_AREA)
+            output = cv.resize(filter_fn(small), (w, h), interpolation=cv.INTER_LINEAR)
+        else:
+            output = filter_fn(frame)
+        self.last_output = output
+        self.num_frames += 1
+        self.window_frames += 1
+        self.level_frames[self.level_idx] += 1
+        return output
+
+    def update(self):
+        now = time.perf_counter()
+        window_secs = (now - self.window_start) / self.window_frames
+        prev_secs = self.level_secs.get(self.level_idx)
+        if prev_secs is None:
+            self.level_secs[self.level_idx] = window_secs
+        else:
+            self.level_secs[self.level_idx] = DEADLINE_SMOOTHING * window_secs + (1 - DEADLINE_SMOOTHING) * prev_secs
+        self.window_start = now
+        self.window_frames = 0
+
+        frames_left = max(0, self.total_frames - self.num_frames)
+        secs_left = self.budget_secs - (now - self.start_time)
+        new_idx = self.level_idx
+        if frames_left * self.level_secs[self.level_idx] > secs_left * DEADLINE_TARGET:
+            # drop straight to the best level that is expected to fit
+            new_idx = len(self.levels) - 1
+            for idx in range(self.level_idx + 1, len(self.levels)):
+                if frames_left * self.get_level_secs(idx) <= secs_left * DEADLINE_TARGET:
+                    new_idx = idx
+                    break
+        elif self.level_idx > 0 and frames_left * self.get_level_secs(self.level_idx - 1) <= secs_left * DEADLINE_RELAX:
+            new_idx = self.level_idx - 1 # climb back one level at a time, with a margin so levels don't flip every check
+        if new_idx != self.level_idx:
+            self.changes.append((self.num_frames, self.level_idx, new_idx))
+            self.level_idx = new_idx
+            self.apply_level()
+
+    # measured secs per frame of a level, or the current level's scaled by the pixels filtered per output frame
+    def get_level_secs(self, idx):
+        if idx in self.level_secs:
+            return self.level_secs[idx]
+        curr, level = self.levels[self.level_idx], self.levels[idx]
+        rel_cost = (level["scale"] ** 2 / level["frame_step"]) / (curr["scale"] ** 2 / curr["frame_step"])
+        return self.level_secs[self.level_idx] * rel_cost
+
+    def apply_level(self):
+        level = self.levels[self.level_idx]
+        preset = self.session.preset
+        preset["retrain_interval"] = self.base_preset["retrain_interval"] * level["palette_mult"]
+        preset["partial_fit_interval"] = self.base_preset["partial_fit_interval"] * level["palette_mult"]
+        preset["elbow"] = self.base_preset["elbow"] and level["elbow"]
+
+    def get_summary(self):
+        elapsed_secs = time.perf_counter() - self.start_time
+        return {
+            "budget_secs": self.budget_secs,
+            "elapsed_secs": elapsed_secs,
+            "met": elapsed_secs <= self.budget_secs,
+            "final_level": self.level_idx,
+            "frames_per_level": {idx: n for idx, n in enumerate(self.level_frames) if n > 0},
+            "changes": [{"frame": frame_num, "from": old_idx, "to": new_idx} for frame_num, old_idx, new_idx in self.changes],
+        }
+
+    # print the choices made and add them to report (if given)
+    def finish(self, report=None):
+        summary = self.get_summary()
+        levels_used = ", ".join(f"level {idx}: {n} frames" for idx, n in summary["frames_per_level"].items())
+        print(f"DEADLINE {'MET' if summary['met'] else 'MISSED'}: {summary['elapsed_secs']:.1f}s of {self.budget_secs:.1f}s budget "
+              f"({levels_used}, {len(self.changes)} level changes)")
+        if report is not None:
+            report.set_info("deadline", summary)
+        return summary
@@ -1,65 +1,395 @@
+import copy
 import numpy as np
 import cv2 as cv
+from concurrent.futures import ThreadPoolExecutor
 from mediafilter.constants import *
 import mediafilter.filters_utils as fu
+from mediafilter.session import FilterSession
+from mediafilter.metrics import count
 
-def get_sketch_frame(frame, bg_color, for_video=False):
+def get_sketch_frame(frame, bg_color, for_video=False, session=None):
+    if session is None:
+        session = FilterSession()
     if for_video == False:
-        frame = fu.normalize_size(frame)
-    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
-    lower_th, upper_th = fu.get_canny_threshs(gray)
-    sigma = fu.get_sigma(gray)
-    edges = fu.get_edges(gray, SKETCH_BLUR, lower_th * SKETCH_THRESH_MULT, upper_th * SKETCH_THRESH_MULT, sigma)
+        with session.time("resize"):
+            frame = fu.normalize_size(frame, session.preset["image_max_side"])
+    edges = get_sketch_edges(frame, for_video, session)
+    return compose_sketch_frame(frame, edges, bg_color, session)
+
+# sketch edges of an already resized frame (temporally smoothed for video), the same for every background colour
+# for video the returned array is overwritten by the next call
+def get_sketch_edges(frame, for_video, session):
+    h, w = frame.shape[:2]
+    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY, dst=session.get_buffer("gray", (h, w)))
+    with session.time("edge_stats"):
+        stats = get_edge_stats(gray, for_video, session)
+    lower_th, upper_th, sigma = stats["lower_th"], stats["upper_th"], stats["sigma"]
+    with session.time("canny"):
+        edges = fu.get_edges(gray, SKETCH_BLUR, lower_th * SKETCH_THRESH_MULT, upper_th * SKETCH_THRESH_MULT, sigma,
+                             blur_img=session.get_buffer("blur", (h, w)), edges=session.get_buffer("edges", (h, w)))
     if for_video == True:
-        edges = fu.smooth_edges(edges)
-        
-    if bg_color == "White":
-        sketch_frame = np.full_like(frame, 255)
-    else:
-        sketch_frame = np.full_like(frame, 0)
-    sketch_frame[edges != 0] = frame[edges != 0]
+        with session.time("smooth_edges"):
+            edges = fu.smooth_edges(edges, session.edge_buffer)
+    return edges
+
+def compose_sketch_frame(frame, edges, bg_color, session):
+    with session.time("compose"):
+        sketch_frame = session.get_output_buffer(frame.shape)
+        if bg_color == "White":
+            sketch_frame.fill(255)
+        else:
+            sketch_frame.fill(0)
+        cv.copyTo(frame, edges, sketch_frame) # keep original colours on edges
 
     return sketch_frame
 
-kmeans = None
-def get_cartoon_frame(frame, frame_idx, for_video=False):
-    global kmeans
+def get_cartoon_frame(frame, frame_idx, for_video=False, session=None):
+    if session is None:
+        session = FilterSession()
     if for_video == False:
-        frame = fu.normalize_size(frame)
+        with session.time("resize"):
+            frame = fu.normalize_size(frame, session.preset["image_max_side"])
+
+    h, w = frame.shape[:2]
+    palette_swapped = collect_palette_fit(session)
+    with session.time("scene_detect"):
+        palette_update = get_palette_update(frame, for_video, session)
+    incremental = for_video == True and session.preset["incremental"]
+    if incremental and palette_update == None and not palette_swapped and session.block_ref is not None and session.block_ref.shape == frame.shape:
+        with session.time("block_diff"):
+            changed = fu.get_changed_blocks(frame, session.block_ref)
+        if changed.mean() <= INCREMENTAL_MAX_CHANGED:
+            return get_incremental_cartoon_frame(frame, changed, session)
 
-    smooth = cv.bilateralFilter(frame, d=BILATERAL_D, sigmaColor=BILATERAL_SIGMA_COLOR, sigmaSpace=BILATERAL_SIGMA_SPACE)
+    with session.time("bilateral"):
+        smooth = fu.smooth_colors(frame, session.preset["smooth_scale"], out=session.get_buffer("smooth", frame.shape))
     pixel_colors = smooth.reshape((-1, 3))
-    if kmeans == None or frame_idx % KMEANS_RETRAIN_INTERVAL == 0: # if kmeans not created or time for new fitting
-        k_min, k_max = fu.get_k_range(frame)
-        if for_video == True:
-            sample = pixel_colors[np.random.choice(len(pixel_colors), size=min(len(pixel_colors), KMEANS_SAMPLE_SIZE), replace=False)]
-            elbow_k = fu.get_k_elbow(sample, k_min=k_min, k_max=k_max, step=KMEANS_STEP, for_vid=True)
-            kmeans = fu.get_kmeans(pixel_colors, num_clusts=elbow_k) # get new centroids (video)
+    update_palette(frame, pixel_colors, palette_update, for_video, session, frame_idx)
+
+    cartoon_frame = session.get_output_buffer(frame.shape)
+    quantize_colors(smooth, session, cartoon_frame, idx_parts=session.get_buffer("lut_idx_parts", frame.shape, np.int32),
+                    idxs=session.get_buffer("lut_idxs", (h, w), np.int32))
+
+    gray = cv.cvtColor(cartoon_frame, cv.COLOR_BGR2GRAY, dst=session.get_buffer("gray", (h, w)))
+    
+    with session.time("edge_stats"):
+        stats = get_edge_stats(gray, for_video, session)
+    lower_th, upper_th, sigma = stats["lower_th"], stats["upper_th"], stats["sigma"]
+    blur_img = session.get_buffer("blur", (h, w))
+    edges = session.get_buffer("edges", (h, w))
+    with session.time("canny"):
+        if  for_video == True:
+            edges = fu.get_edges(gray, CARTOON_EDGE_KERNEL_VID, lower_th * CARTOON_THRESH_MULT_VID, upper_th * CARTOON_THRESH_MULT_VID, sigma, blur_img, edges)
         else:
-            sample = pixel_colors[np.random.choice(len(pixel_colors), size=min(len(pixel_colors), KMEANS_SAMPLE_SIZE), replace=False)]
-            elbow_k = fu.get_k_elbow(sample, k_min=k_min, k_max=k_max, step=KMEANS_STEP, for_vid=False)
-            kmeans = fu.get_kmeans(pixel_colors, num_clusts=elbow_k) # get new centroids (img)
+            edges = fu.get_edges(gray, CARTOON_EDGE_KERNEL_IMG, lower_th, upper_th, sigma, blur_img, edges)
+
+    if incremental: # keep whole frame layers for the following incremental frames
+        count(session.report, "full_frames")
+        session.block_ref = copy_into(session.block_ref, frame)
+        session.block_quantized = copy_into(session.block_quantized, cartoon_frame)
+        session.block_edges = copy_into(session.block_edges, edges)
+
+    if for_video == True:
+        with session.time("smooth_edges"):
+            edges = fu.smooth_edges(edges, session.edge_buffer)
+
+    # darken quantized colours on edges
+    with session.time("compose"):
+        dark = cv.LUT(cartoon_frame, fu.get_dark_lut(), dst=session.get_buffer("dark", frame.shape))
+        cv.copyTo(dark, edges, cartoon_frame)
+    return cartoon_frame
+
+# one filtered frame per (filter_type, bg_color) variant of the same input frame
+# sketch edges are only found once and composed over each background colour
+# sessions -> {filter_type: FilterSession}, sketch variants share their session's output buffers
+def get_variant_frames(frame, frame_idx, variants, for_video=False, sessions=None):
+    if sessions is None:
+        sessions = {filter_type: FilterSession() for filter_type, _ in variants}
+    if for_video == False:
+        session = sessions[variants[0][0]]
+        with session.time("resize"):
+            frame = fu.normalize_size(frame, session.preset["image_max_side"])
+
+    sketch_edges = None
+    cartoon_frame = None
+    variant_frames = []
+    for filter_type, bg_color in variants:
+        session = sessions[filter_type]
+        if filter_type == "Sketch":
+            if sketch_edges is None:
+                sketch_edges = get_sketch_edges(frame, for_video, session)
+            variant_frames.append(compose_sketch_frame(frame, sketch_edges, bg_color, session))
+        else:
+            if cartoon_frame is None: # already resized, so image frames aren't resized again
+                cartoon_frame = get_cartoon_frame(frame, frame_idx, for_video, session)
+            variant_frames.append(cartoon_frame)
+    return variant_frames
+
+# video frame where only the changed blocks (fu.get_changed_blocks) are refiltered, with a margin so the
+# filters see the same neighbourhood as on a whole frame; the other blocks reuse their last quantized colours + edges
+# canny thresholds stay at the last whole frame's so blocks filtered on different frames match
+def get_incremental_cartoon_frame(frame, changed, session):
+    h, w = frame.shape[:2]
+    stats = session.edge_stats
+    margin = INCREMENTAL_MARGIN
+    count(session.report, "incremental_frames")
+    count(session.report, "blocks_refiltered", int(np.count_nonzero(changed)))
+    for y, x, core_h, core_w in fu.get_block_runs(changed, INCREMENTAL_BLOCK_SIZE, h, w):
+        y0, x0 = max(0, y - margin), max(0, x - margin)
+        y1, x1 = min(h, y + core_h + margin), min(w, x + core_w + margin)
+        quantized, edges = get_cartoon_layers(frame[y0:y1, x0:x1], stats, session, for_video=True)
+        session.block_quantized[y:y + core_h, x:x + core_w] = quantized[y - y0:y - y0 + core_h, x - x0:x - x0 + core_w]
+        session.block_edges[y:y + core_h, x:x + core_w] = edges[y - y0:y - y0 + core_h, x - x0:x - x0 + core_w]
+        session.block_ref[y:y + core_h, x:x + core_w] = frame[y:y + core_h, x:x + core_w]
+
+    with session.time("smooth_edges"):
+        edges = fu.smooth_edges(session.block_edges, session.edge_buffer)
+    with session.time("compose"):
+        cartoon_frame = session.get_output_buffer(frame.shape)
+        np.copyto(cartoon_frame, session.block_quantized)
+        dark = cv.LUT(cartoon_frame, fu.get_dark_lut(), dst=session.get_buffer("dark", frame.shape))
+        cv.copyTo(dark, edges, cartoon_frame)
+    return cartoon_frame
+
+# copy of src, reusing dst's memory when it has the same shape
+def copy_into(dst, src):
+    if dst is None or dst.shape != src.shape:
+        return src.copy()
+    np.copyto(dst, src)
+    return dst
+
+# full resolution image (no normalize_size) filtered in overlapping tiles on a thread pool
+# palette + edge thresholds come from one downsampled copy so every tile uses the same ones,
+# only the centre of each tile is kept (overlap covers the filters' reach) so there are no seams
+# memory used beyond input/output frames is bounded by tile_size * num_workers
+def get_tiled_frame(frame, filter_type, bg_color="", session=None, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, num_workers=TILE_WORKERS):
+    if session is None:
+        session = FilterSession()
+    with session.time("resize"):
+        small = fu.normalize_size(frame, session.preset["image_max_side"])
+
+    if filter_type == "Sketch":
+        with session.time("edge_stats"):
+            stats = fu.get_frame_stats(cv.cvtColor(small, cv.COLOR_BGR2GRAY))
+        filter_tile = lambda tile: get_sketch_tile(tile, bg_color, stats, session)
     else:
-        sample = pixel_colors[np.random.choice(len(pixel_colors), size=min(len(pixel_colors), KMEANS_SAMPLE_SIZE), replace=False)]
-        kmeans.partial_fit(sample)
+        with session.time("bilateral"):
+            smooth = fu.smooth_colors(small, session.preset["smooth_scale"])
+        update_palette(small, smooth.reshape((-1, 3)), "retrain", False, session, 0)
+        quantized = quantize_colors(smooth, session, np.empty_like(smooth))
+        with session.time("edge_stats"):
+            stats = fu.get_frame_stats(cv.cvtColor(quantized, cv.COLOR_BGR2GRAY))
+        filter_tile = lambda tile: get_cartoon_tile(tile, stats, session)
+
+    h, w = frame.shape[:2]
+    output_frame = np.empty_like(frame)
 
-    labels = kmeans.predict(pixel_colors) # pixels to color clusters
-    quantized = kmeans.cluster_centers_[labels].astype('uint8')
-    quantized = quantized.reshape(smooth.shape)
+    def process_tile(y, x):
+        # tile + overlap on each side, clipped to the frame
+        y0, x0 = max(0, y - overlap), max(0, x - overlap)
+        y1, x1 = min(h, y + tile_size + overlap), min(w, x + tile_size + overlap)
+        filtered_tile = filter_tile(frame[y0:y1, x0:x1])
+        core_h, core_w = min(tile_size, h - y), min(tile_size, w - x)
+        output_frame[y:y + core_h, x:x + core_w] = filtered_tile[y - y0:y - y0 + core_h, x - x0:x - x0 + core_w]
 
+    with ThreadPoolExecutor(max_workers=num_workers) as pool: # opencv releases the gil
+        tile_futures = [pool.submit(process_tile, y, x) for y in range(0, h, tile_size) for x in range(0, w, tile_size)]
+        for tile_future in tile_futures:
+            tile_future.result()
+    return output_frame
+
+def get_sketch_tile(tile, bg_color, stats, session):
+    gray = cv.cvtColor(tile, cv.COLOR_BGR2GRAY)
+    with session.time("canny"):
+        edges = fu.get_edges(gray, SKETCH_BLUR, stats["lower_th"] * SKETCH_THRESH_MULT, stats["upper_th"] * SKETCH_THRESH_MULT, stats["sigma"])
+    with session.time("compose"):
+        sketch_tile = np.full_like(tile, 255 if bg_color == "White" else 0)
+        cv.copyTo(tile, edges, sketch_tile)
+    return sketch_tile
+
+def get_cartoon_tile(tile, stats, session):
+    cartoon_tile, edges = get_cartoon_layers(tile, stats, session, for_video=False)
+    with session.time("compose"):
+        cv.copyTo(cv.LUT(cartoon_tile, fu.get_dark_lut()), edges, cartoon_tile)
+    return cartoon_tile
+
+# quantized colours + edges of part of a frame using an existing palette and edge stats (tiles, changed blocks)
+def get_cartoon_layers(region, stats, session, for_video):
+    with session.time("bilateral"):
+        smooth = fu.smooth_colors(region, session.preset["smooth_scale"])
+    quantized = quantize_colors(smooth, session, smooth) # quantize in place
     gray = cv.cvtColor(quantized, cv.COLOR_BGR2GRAY)
-    
-    lower_th, upper_th = fu.get_canny_threshs(gray)
-    sigma = fu.get_sigma(gray)
-    if  for_video == True:
-        edges = fu.get_edges(gray, CARTOON_EDGE_KERNEL_VID, lower_th * CARTOON_THRESH_MULT_VID, upper_th * CARTOON_THRESH_MULT_VID, sigma)
+    with session.time("canny"):
+        if for_video == True:
+            edges = fu.get_edges(gray, CARTOON_EDGE_KERNEL_VID, stats["lower_th"] * CARTOON_THRESH_MULT_VID,
+                                 stats["upper_th"] * CARTOON_THRESH_MULT_VID, stats["sigma"])
+        else:
+            edges = fu.get_edges(gray, CARTOON_EDGE_KERNEL_IMG, stats["lower_th"], stats["upper_th"], stats["sigma"])
+    return quantized, edges
+
+# retrain / partial fit the palette (palette_update from get_palette_update) and rebuild the colour lookup table
+# with session.palette_worker (live mode) the fit runs in the background on copies and is swapped in on a later frame,
+# frames keep using the current palette meanwhile (only the very first palette is fitted inline), get_palette_update
+# holds updates back while a fit is running so one is never submitted on top of another
+# a retrain reseeds the session rng from (seed, frame_idx), so the palette fitted at a frame doesn't depend on how many
+# samples were drawn before it (segment-parallel jobs retrain at the same frames as a sequential run with the same palettes)
+def update_palette(frame, pixel_colors, palette_update, for_video, session, frame_idx=0):
+    if palette_update == None:
+        return
+    if palette_update == "retrain":
+        session.rng = np.random.default_rng((session.seed, frame_idx))
+    sample_size = min(len(pixel_colors), session.preset["kmeans_sample_size"])
+    sample = pixel_colors[session.rng.choice(len(pixel_colors), size=sample_size, replace=False)]
+
+    if session.palette_worker is not None and session.kmeans is not None:
+        kmeans = copy.deepcopy(session.kmeans) if palette_update == "partial_fit" else None # frames still predict with the current one
+        session.palette_future = session.palette_worker.submit(fit_palette, frame.copy(), pixel_colors.copy(), sample, palette_update,
+                                                               for_video, session, kmeans, session.lut)
+        return
+    set_palette(session, *fit_palette(frame, pixel_colors, sample, palette_update, for_video, session, session.kmeans, session.lut))
+
+# returns (kmeans, lut, retrained) without changing the session's palette
+# kmeans -> model to partial fit (in place), lut -> current lookup table (kept as is after a partial fit that doesn't use one)
+def fit_palette(frame, pixel_colors, sample, palette_update, for_video, session, kmeans, lut):
+    retrained = palette_update == "retrain"
+    if retrained: # kmeans not created or new scene
+        count(session.report, "retrains")
+        color_stats = fu.get_frame_stats(frame=frame)
+        k_min, k_max = color_stats["k_min"], color_stats["k_max"]
+        k_step = session.preset["k_step"]
+        fit_colors = sample if session.preset["fit_on_sample"] else pixel_colors
+        if not session.preset["elbow"]:
+            elbow_k = k_max # fixed k (top of the frame's k band), no elbow search
+        elif for_video == True:
+            with session.time("elbow"):
+                elbow_k = fu.get_k_elbow(sample, k_min=k_min, k_max=k_max, step=k_step, for_vid=True)
+        else:
+            with session.time("elbow"):
+                elbow_k = fu.get_k_elbow(sample, k_min=k_min, k_max=k_max, step=k_step, for_vid=False)
+        with session.time("kmeans_fit"):
+            kmeans = fu.get_kmeans(fit_colors, num_clusts=elbow_k) # get new centroids
+    elif palette_update == "partial_fit": # palette drifting
+        count(session.report, "partial_fits")
+        with session.time("partial_fit"):
+            kmeans.partial_fit(sample)
+
+    # centroids changed -> rebuild colour lookup table
+    if QUANT_USE_LUT and (retrained or lut is not None):
+        with session.time("build_lut"):
+            lut = fu.get_color_lut(kmeans.cluster_centers_)
+            if retrained and fu.get_lut_error(sample[:QUANT_LUT_CHECK_SIZE], lut, kmeans) > QUANT_LUT_MAX_ERROR:
+                lut = None # too far from exact predict, don't use lut until next retrain
+    return kmeans, lut, retrained
+
+# swap in a background fit that has finished, True if the palette changed
+def collect_palette_fit(session):
+    if session.palette_future is None or not session.palette_future.done():
+        return False
+    set_palette(session, *session.palette_future.result())
+    session.palette_future = None
+    return True
+
+def set_palette(session, kmeans, lut, retrained):
+    session.kmeans = kmeans
+    session.lut = lut
+    if retrained:
+        session.edge_stats = None # new scene, don't smooth thresholds with the old one
+
+# smoothed frame -> nearest palette colours (lut if available, else exact predict)
+# only reads the palette so tiles can be quantized from several threads
+def quantize_colors(smooth, session, out, idx_parts=None, idxs=None):
+    if session.lut is not None:
+        with session.time("quantize_lut"):
+            fu.quantize_lut(smooth, session.lut, out=out, idx_parts=idx_parts, idxs=idxs)
     else:
-        edges = fu.get_edges(gray, CARTOON_EDGE_KERNEL_IMG, lower_th, upper_th, sigma)
+        with session.time("predict"):
+            labels = session.kmeans.predict(smooth.reshape((-1, 3))) # pixels to color clusters
+            quantized = session.kmeans.cluster_centers_[labels].astype('uint8')
+            np.copyto(out, quantized.reshape(smooth.shape))
+    return out
 
-    if for_video == True:
-        edges = fu.smooth_edges(edges)
+# canny thresholds + blur sigma, smoothed across video frames
+def get_edge_stats(gray, for_video, session):
+    if for_video == False:
+        return fu.get_frame_stats(gray)
+    session.edge_stats = fu.get_frame_stats(gray, prev_stats=session.edge_stats)
+    return session.edge_stats
+
+# decide if palette needs a full retrain (first frame or scene cut), a partial fit (drifting) or nothing (stable)
+# frames are compared with a running (ema) signature of the recent frames of the scene, a cut has to last
+# SCENE_CUT_FRAMES frames (frames that look like a cut aren't blended in, so the cut is judged against the old scene),
+# drift is measured between the running signature and the one the palette was fitted on
+def get_palette_update(frame, for_video, session):
+    if for_video == False:
+        return "retrain"
+
+    sig = fu.get_color_signature(frame)
+    session.frames_since_retrain += 1
+    session.frames_since_fit += 1
+    cut = False
+    if session.kmeans is None:
+        palette_update = "retrain"
+    else:
+        preset = session.preset
+        rollback = session.cut_rollback
+        if rollback is not None: # palette was refitted on a suspected cut, the old scene coming back means it was a flash
+            if fu.get_color_dist(sig, rollback["scene_sig"]) <= preset["scene_cut_thresh"]:
+                rollback_cut(session)
+            else:
+                rollback["frames_left"] -= 1
+                if rollback["frames_left"] == 0:
+                    session.cut_rollback = None
+        if fu.get_color_dist(sig, session.scene_sig) > preset["scene_cut_thresh"]:
+            session.scene_cut_frames += 1
+        else:
+            session.scene_cut_frames = 0
+            session.scene_sig = fu.blend_color_signature(session.scene_sig, sig)
+        # inline fits retrain on the first cut frame (undone above if it was a flash), background fits can't be undone and
+        # the cut frames keep the old palette until the fit is swapped in anyway, so they wait for SCENE_CUT_FRAMES frames
+        cut = session.scene_cut_frames >= (1 if session.palette_worker is None else SCENE_CUT_FRAMES)
+        drift = fu.get_color_dist(session.scene_sig, session.palette_color_sig) # change since palette was last fitted
+        if cut or drift > preset["scene_cut_thresh"] or session.frames_since_retrain >= preset["retrain_interval"]:
+            palette_update = "retrain"
+        elif drift > PALETTE_DRIFT_THRESH or session.frames_since_fit >= preset["partial_fit_interval"]:
+            palette_update = "partial_fit"
+        else:
+            palette_update = None
+
+    # background fit still running -> keep the update pending (retrain wins over partial fit) and submit it once the fit
+    # has been swapped in, sig + counters only move on when an update is returned (it is always fitted)
+    pending = session.pending_palette_update
+    if pending == "retrain" or (pending == "partial_fit" and palette_update == None):
+        palette_update = pending
+    if session.palette_future is not None:
+        if palette_update != None:
+            count(session.report, "palette_updates_deferred")
+        session.pending_palette_update = palette_update
+        return None
+    session.pending_palette_update = None
 
-    cartoon_frame = quantized.copy()
+    if palette_update == "retrain": # new scene starts from this frame
+        if cut and session.palette_worker is None and SCENE_CUT_FRAMES > 1:
+            session.cut_rollback = {"kmeans": session.kmeans, "lut": session.lut, "scene_sig": session.scene_sig,
+                                    "palette_color_sig": session.palette_color_sig, "frames_since_retrain": session.frames_since_retrain,
+                                    "frames_since_fit": session.frames_since_fit, "edge_stats": session.edge_stats,
+                                    "frames_left": SCENE_CUT_FRAMES - 1}
+        session.frames_since_retrain = 0
+        session.scene_cut_frames = 0
+        session.scene_sig = sig
+    if palette_update != None:
+        session.frames_since_fit = 0
+        session.palette_color_sig = session.scene_sig
+    return palette_update
 
-    cartoon_frame[edges != 0] = (cartoon_frame[edges != 0] * DARK_FACTOR).astype(np.uint8)
-    return cartoon_frame
\ No newline at end of file
+# a retrain on a suspected cut turned out to be a flash, go back to the palette (and scene) from before it
+def rollback_cut(session):
+    rollback = session.cut_rollback
+    frames_since_cut = SCENE_CUT_FRAMES - rollback["frames_left"]
+    session.kmeans, session.lut, session.edge_stats = rollback["kmeans"], rollback["lut"], rollback["edge_stats"]
+    session.scene_sig, session.palette_color_sig = rollback["scene_sig"], rollback["palette_color_sig"]
+    session.frames_since_retrain = rollback["frames_since_retrain"] + frames_since_cut
+    session.frames_since_fit = rollback["frames_since_fit"] + frames_since_cut
+    session.scene_cut_frames = 0
+    session.cut_rollback = None
+    session.block_ref = None # incremental blocks were quantized with the flash palette, next frame is filtered whole
+    count(session.report, "cut_rollbacks")
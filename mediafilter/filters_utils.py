@@ -1,25 +1,39 @@
 import numpy as np
+from functools import lru_cache
 import cv2 as cv
-from sklearn.cluster import MiniBatchKMeans
-from collections import deque
-from kneed import KneeLocator
 from mediafilter.constants import *
 
-def normalize_size(img):
+# sklearn and kneed take ~1s each to import and only the cartoon filter needs them, so they are imported on first use
+
+def normalize_size(img, max_side=IMAGE_MAX_SIDE):
     h, w = img.shape[:2]
-    if max(h, w) <= IMAGE_MAX_SIDE:
+    if max(h, w) <= max_side:
         return img
-    scale = IMAGE_MAX_SIDE / max(h, w)
+    scale = max_side / max(h, w)
     norm_w = max(1, int(w * scale))
     norm_h = max(1, int(h * scale))
     norm_img = cv.resize(img, (norm_w, norm_h), interpolation=cv.INTER_AREA)
     return norm_img
 
+# edge preserving colour smoothing for the cartoon filter
+# scale < 1 -> bilateral on a downscaled frame (kernel + spatial sigma scaled to match) then upsampled, much cheaper
+def smooth_colors(frame, scale=1.0, out=None):
+    if scale >= 1:
+        return cv.bilateralFilter(frame, d=BILATERAL_D, sigmaColor=BILATERAL_SIGMA_COLOR, sigmaSpace=BILATERAL_SIGMA_SPACE, dst=out)
+    h, w = frame.shape[:2]
+    small = cv.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv.INTER_AREA)
+    small_d = max(3, int(round(BILATERAL_D * scale)) | 1)
+    small = cv.bilateralFilter(small, d=small_d, sigmaColor=BILATERAL_SIGMA_COLOR, sigmaSpace=BILATERAL_SIGMA_SPACE * scale)
+    return cv.resize(small, (w, h), dst=out, interpolation=cv.INTER_LINEAR)
+
 def get_canny_threshs(img): # thresholds for edge detection 
     grad_x = cv.Sobel(img, cv.CV_64F, 1, 0, ksize=3)
     grad_y = cv.Sobel(img, cv.CV_64F, 0, 1, ksize=3)
     grad_mag = cv.magnitude(grad_x, grad_y)
     med = float(np.median(grad_mag))
+    return get_canny_threshs_from_med(med)
+
+def get_canny_threshs_from_med(med):
     lower = int(max(0, min(CANNY_LOWER_RATIO * med, 255)))
     upper = int(max(0, min(CANNY_UPPER_RATIO * med, 255)))
     if upper <= lower:
@@ -28,6 +42,9 @@ def get_canny_threshs(img): # thresholds for edge detection
 
 def get_sigma(img): # calculate how much blur to use for gaussianBlur
     sharpness = cv.Laplacian(img, cv.CV_64F).var()
+    return get_sigma_from_sharpness(sharpness)
+
+def get_sigma_from_sharpness(sharpness):
     base_sigma = GAUS_BASE_SIGMA
     if sharpness > GAUS_SIGMA_THRESH_HIGH:    
         return base_sigma * GAUS_SIGMA_MULT_HIGH
@@ -35,56 +52,207 @@ def get_sigma(img): # calculate how much blur to use for gaussianBlur
         return base_sigma * GAUS_SIGMA_MULT_MED
     else:
         return base_sigma
+
+# canny thresholds, blur sigma (from gray) and k range (from bgr frame) in one pass over every STATS_ROW_STEP-th row
+# rows are sampled at full res so gradient/laplacian values stay on the same scale as get_canny_threshs/get_sigma
+# prev_stats (video) -> gradient median and sharpness are smoothed between frames so thresholds don't jitter
+def get_frame_stats(gray=None, frame=None, prev_stats=None, smoothing=STATS_SMOOTHING):
+    stats = {}
+    img = gray if gray is not None else frame
+    rows = np.arange(1, img.shape[0] - 1, STATS_ROW_STEP)
+
+    if gray is not None:
+        if len(rows) == 0 or gray.shape[1] < 3: # too small to sample
+            grad_med = float(np.median(cv.magnitude(cv.Sobel(gray, cv.CV_32F, 1, 0), cv.Sobel(gray, cv.CV_32F, 0, 1))))
+            sharpness = float(cv.Laplacian(gray, cv.CV_32F).var())
+        else:
+            top = gray[rows - 1].astype(np.int32)
+            mid = gray[rows].astype(np.int32)
+            bot = gray[rows + 1].astype(np.int32)
+
+            # 3x3 sobel
+            vert = top + 2 * mid + bot
+            grad_x = vert[:, 2:] - vert[:, :-2]
+            vert_diff = bot - top
+            grad_y = vert_diff[:, :-2] + 2 * vert_diff[:, 1:-1] + vert_diff[:, 2:]
+            grad_mag = np.sqrt((grad_x * grad_x + grad_y * grad_y).astype(np.float32))
+            grad_med = get_hist_median(grad_mag)
+
+            # 3x3 laplacian (same kernel as cv.Laplacian ksize=1)
+            lap = top[:, 1:-1] + bot[:, 1:-1] + mid[:, :-2] + mid[:, 2:] - 4 * mid[:, 1:-1]
+            sharpness = float(lap.var())
+
+        if prev_stats is not None and "grad_med" in prev_stats:
+            grad_med = smoothing * grad_med + (1 - smoothing) * prev_stats["grad_med"]
+            sharpness = smoothing * sharpness + (1 - smoothing) * prev_stats["sharpness"]
+        stats["grad_med"] = grad_med
+        stats["sharpness"] = sharpness
+        stats["lower_th"], stats["upper_th"] = get_canny_threshs_from_med(grad_med)
+        stats["sigma"] = get_sigma_from_sharpness(sharpness)
+
+    if frame is not None:
+        sample = frame[rows] if len(rows) > 0 else frame
+        hues, sats = cv.split(cv.cvtColor(sample, cv.COLOR_BGR2HSV))[:2]
+        hue_var = float(np.var(hues))
+        avg_sat = float(np.mean(sats))
+        unique_colors = int(np.count_nonzero(np.bincount(hues.ravel(), minlength=180)))
+        stats["k_min"], stats["k_max"] = get_k_range_from_stats(hue_var, avg_sat, unique_colors)
+
+    return stats
+
+# median of non-negative values from a histogram with 1 unit wide bins
+def get_hist_median(values):
+    counts = np.bincount(values.astype(np.int32).ravel())
+    cum_counts = np.cumsum(counts)
+    return float(np.searchsorted(cum_counts, cum_counts[-1] / 2))
     
-def get_edges(img, k_size, lower_th, upper_th, sigma):
+def get_edges(img, k_size, lower_th, upper_th, sigma, blur_img=None, edges=None): # blur_img/edges -> optional preallocated outputs
     k_size = max(MIN_BLUR_KERNEL, k_size | 1)
-    blur_img = cv.GaussianBlur(img, (k_size, k_size), sigma)
-    edges = cv.Canny(blur_img, lower_th, upper_th)
+    blur_img = cv.GaussianBlur(img, (k_size, k_size), sigma, dst=blur_img)
+    edges = cv.Canny(blur_img, lower_th, upper_th, edges=edges)
     return edges
 
 # fit new kmeans with new color centroids
 def get_kmeans(pix_colors, num_clusts):
+    from sklearn.cluster import MiniBatchKMeans
     new_kmeans = MiniBatchKMeans(n_clusters=num_clusts, random_state=0, batch_size=KMEANS_BATCH_FIT, n_init="auto")
     new_kmeans.fit(pix_colors)
     return new_kmeans
 
+# nearest centroid colour for every cell of a (2^bits)^3 bgr cube
+def get_color_lut(centers, bits=QUANT_LUT_BITS):
+    levels = 1 << bits
+    step = 256 // levels
+    cell_vals = np.arange(levels, dtype=np.float32) * step + (step - 1) / 2 # centre of each cell
+    b, g, r = np.meshgrid(cell_vals, cell_vals, cell_vals, indexing="ij")
+    cells = np.stack([b.ravel(), g.ravel(), r.ravel()], axis=1)
+    centers = np.asarray(centers, dtype=np.float32)
+    dists = (centers ** 2).sum(axis=1) - 2 * (cells @ centers.T) # ||cell||^2 term is the same for every centroid
+    nearest = np.argmin(dists, axis=1)
+    return centers[nearest].astype(np.uint8)
+
+# per channel table turning b, g, r values into their part of the cube cell index
+@lru_cache(maxsize=None)
+def get_cell_idx_lut(bits):
+    cell_vals = np.arange(256, dtype=np.int32) >> (8 - bits)
+    return np.stack([cell_vals << (2 * bits), cell_vals << bits, cell_vals], axis=1).reshape(1, 256, 3)
+
+# replace every pixel with its lut colour (one table lookup instead of kmeans.predict)
+# out/idx_parts/idxs can be preallocated (h, w, 3) uint8 / (h, w, 3) int32 / (h, w) int32 arrays
+def quantize_lut(img, lut, bits=QUANT_LUT_BITS, out=None, idx_parts=None, idxs=None):
+    idx_parts = cv.LUT(img, get_cell_idx_lut(bits), dst=idx_parts)
+    idxs = np.add(idx_parts[..., 0], idx_parts[..., 1], out=idxs)
+    np.add(idxs, idx_parts[..., 2], out=idxs)
+    return np.take(lut, idxs, axis=0, out=out, mode="clip")
+
+# mean abs colour difference between lut and exact kmeans.predict quantization
+def get_lut_error(pix_colors, lut, kmeans, bits=QUANT_LUT_BITS):
+    exact = kmeans.cluster_centers_[kmeans.predict(pix_colors)].astype(np.uint8)
+    approx = quantize_lut(pix_colors.reshape(-1, 1, 3), lut, bits).reshape(-1, 3)
+    return float(np.mean(cv.absdiff(exact, approx)))
+
+# darkened value for every uint8 value (same truncation as (val * DARK_FACTOR).astype(uint8))
+def get_dark_lut(dark_factor=DARK_FACTOR):
+    return (np.arange(256) * dark_factor).astype(np.uint8)
+
 # reduce edge flickering in video
-edge_buffer = deque(maxlen=EDGE_BUFFER_LEN)
-def smooth_edges(curr_edges, min_weight=EDGE_MIN_WEIGHT, max_weight=EDGE_MAX_WEIGHT): # small weight -> more past frame influence
-    global edge_buffer
-    curr_edges = curr_edges.astype(np.float32)
-
-    if len(edge_buffer) == 0:
-        edge_buffer.append(curr_edges)
-        return curr_edges.astype(np.uint8)
-    
-    prev_smoothed = edge_buffer[-1] # get last frame edges
-    edge_diff = np.mean(cv.absdiff(curr_edges.astype(np.uint8), prev_smoothed.astype(np.uint8)))
-    motion = edge_diff / 255.0
+def smooth_edges(curr_edges, edge_buffer, min_weight=EDGE_MIN_WEIGHT, max_weight=EDGE_MAX_WEIGHT): # small weight -> more past frame influence
+    return edge_buffer.smooth(curr_edges, min_weight, max_weight)
+
+# past edge frames in a preallocated ring with a running sum, so blending costs the same for any buffer length
+# smooth() returns an internal array that is overwritten on the next call
+class EdgeSmoother:
+    def __init__(self, buffer_len=EDGE_BUFFER_LEN):
+        self.capacity = max(1, buffer_len - 1) # past frames kept (buffer_len includes the current frame)
+        self.ring = None
+        self.count = 0
+        self.pos = 0
+
+    def __len__(self):
+        return self.count
+
+    # only the past frames are saved (checkpoints), the running sum + scratch arrays are rebuilt on load
+    def __getstate__(self):
+        return {"capacity": self.capacity, "ring": self.ring, "count": self.count, "pos": self.pos}
+
+    def __setstate__(self, state):
+        self.capacity = state["capacity"]
+        self.ring = None
+        if state["ring"] is not None:
+            self.alloc(state["ring"].shape[1:])
+            np.copyto(self.ring, state["ring"])
+            for slot in range(state["count"]):
+                cv.accumulate(self.ring[(state["pos"] - 1 - slot) % self.capacity], self.hist_sum)
+        self.count = state["count"]
+        self.pos = state["pos"]
 
-    blend_weight = min_weight + (max_weight - min_weight) * motion # more motion -> larger weight -> less past frame influence
+    def clear(self):
+        self.count = 0
+        self.pos = 0
+        if self.ring is not None:
+            self.hist_sum.fill(0)
 
-    edge_buffer.append(curr_edges)
+    def alloc(self, shape):
+        self.ring = np.zeros((self.capacity,) + shape, dtype=np.uint8)
+        self.hist_sum = np.zeros(shape, dtype=np.float32) # sum of all frames in ring
+        self.diff = np.empty(shape, dtype=np.uint8)
+        self.blend = np.empty(shape, dtype=np.float32)
+        self.smoothed = np.empty(shape, dtype=np.uint8)
+        self.count = 0
+        self.pos = 0
 
-    smoothed = blend_weight * edge_buffer[-1]
-    remaining_weight = (1 - blend_weight) / (len(edge_buffer) - 1)
-    for i in range(len(edge_buffer) - 1):
-        smoothed += remaining_weight * edge_buffer[i]
-    smoothed = np.clip(smoothed, 0, 255).astype(np.uint8)
-    return smoothed
+    def push(self, edges):
+        slot = self.ring[self.pos]
+        if self.count == self.capacity:
+            np.subtract(self.hist_sum, slot, out=self.hist_sum) # drop oldest frame from sum
+        else:
+            self.count += 1
+        np.copyto(slot, edges)
+        cv.accumulate(edges, self.hist_sum)
+        self.pos = (self.pos + 1) % self.capacity
+
+    def smooth(self, curr_edges, min_weight=EDGE_MIN_WEIGHT, max_weight=EDGE_MAX_WEIGHT):
+        if self.ring is None or self.ring.shape[1:] != curr_edges.shape:
+            self.alloc(curr_edges.shape)
+
+        if self.count == 0:
+            self.push(curr_edges)
+            np.copyto(self.smoothed, curr_edges)
+            return self.smoothed
+
+        prev_edges = self.ring[self.pos - 1] # get last frame edges
+        cv.absdiff(curr_edges, prev_edges, dst=self.diff)
+        motion = cv.mean(self.diff)[0] / 255.0
+
+        blend_weight = min_weight + (max_weight - min_weight) * motion # more motion -> larger weight -> less past frame influence
+
+        # blend_weight * current + (1 - blend_weight) * mean of past frames
+        np.multiply(self.hist_sum, 1.0 / self.count, out=self.blend)
+        cv.accumulateWeighted(curr_edges, self.blend, blend_weight)
+        np.copyto(self.smoothed, self.blend, casting="unsafe")
+
+        self.push(curr_edges)
+        return self.smoothed
 
 # calc number of clusters to use for kmeans
 def get_k_elbow(pix_colors, k_min, k_max, step, for_vid):
-    inertias = []
+    from kneed import KneeLocator
     ks = range(k_min, k_max + 1, step)
-    if for_vid == True:
-        bs = KMEANS_BATCH_VID
+    if len(ks) < 3: # no curve to find a knee in (large step)
+        return ks[len(ks) // 2]
+    if KMEANS_ELBOW_FAST == True:
+        inertias = get_elbow_inertias(pix_colors, ks)
     else:
-        bs = KMEANS_BATCH_IMG
-    for k in ks:
-        kmeans = MiniBatchKMeans(n_clusters=k, random_state=0, batch_size=bs, n_init="auto")
-        kmeans.fit(pix_colors)
-        inertias.append(kmeans.inertia_)
+        inertias = []
+        if for_vid == True:
+            bs = KMEANS_BATCH_VID
+        else:
+            bs = KMEANS_BATCH_IMG
+        from sklearn.cluster import MiniBatchKMeans
+        for k in ks:
+            kmeans = MiniBatchKMeans(n_clusters=k, random_state=0, batch_size=bs, n_init="auto")
+            kmeans.fit(pix_colors)
+            inertias.append(kmeans.inertia_)
 
     kl = KneeLocator(ks, inertias, curve="convex", direction="decreasing")
     best_k = kl.knee
@@ -92,6 +260,121 @@ def get_k_elbow(pix_colors, k_min, k_max, step, for_vid):
         best_k = ks[len(ks) // 2]
     return best_k
 
+# inertia for each k using lloyd's on a colour histogram, each k warm started from the previous k's centroids
+def get_elbow_inertias(pix_colors, ks):
+    colors, counts = get_color_hist(pix_colors)
+    rng = np.random.default_rng(0)
+    centers = np.empty((0, 3))
+    inertias = []
+    for k in ks:
+        centers = add_kmeans_pp_centers(colors, counts, centers, k, rng)
+        centers, inertia = run_lloyd(colors, counts, centers)
+        inertias.append(inertia)
+    return inertias
+
+# unique colours (mean colour of each occupied cell of a (2^bits)^3 cube) and how many pixels fell in each
+def get_color_hist(pix_colors, bits=KMEANS_ELBOW_HIST_BITS):
+    shift = 8 - bits
+    cells = pix_colors >> shift
+    idxs = (cells[:, 0].astype(np.int32) << (2 * bits)) | (cells[:, 1].astype(np.int32) << bits) | cells[:, 2]
+    num_cells = 1 << (3 * bits)
+    counts = np.bincount(idxs, minlength=num_cells)
+    sums = np.stack([np.bincount(idxs, weights=pix_colors[:, c], minlength=num_cells) for c in range(3)], axis=1)
+    occupied = counts > 0
+    return sums[occupied] / counts[occupied, None], counts[occupied].astype(np.float64)
+
+def get_sq_dists(points, centers):
+    return np.maximum((points ** 2).sum(axis=1)[:, None] - 2 * (points @ centers.T) + (centers ** 2).sum(axis=1), 0)
+
+# add centers (weighted kmeans++ seeding) until there are k
+def add_kmeans_pp_centers(points, weights, centers, k, rng):
+    k = min(k, len(points))
+    if len(centers) == 0:
+        centers = points[[rng.choice(len(points), p=weights / weights.sum())]]
+    while len(centers) < k:
+        min_dists = get_sq_dists(points, centers).min(axis=1) * weights
+        if min_dists.sum() == 0:
+            break
+        centers = np.vstack([centers, points[rng.choice(len(points), p=min_dists / min_dists.sum())]])
+    return centers
+
+# weighted lloyd's iterations, returns (centers, inertia)
+def run_lloyd(points, weights, centers, max_iter=KMEANS_ELBOW_MAX_ITER, tol=KMEANS_ELBOW_TOL):
+    k = len(centers)
+    for _ in range(max_iter):
+        labels = np.argmin(get_sq_dists(points, centers), axis=1)
+        clust_weights = np.bincount(labels, weights=weights, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=weights * points[:, c], minlength=k) for c in range(3)], axis=1)
+        new_centers = centers.copy()
+        filled = clust_weights > 0
+        new_centers[filled] = sums[filled] / clust_weights[filled, None]
+        shift = np.abs(new_centers - centers).max()
+        centers = new_centers
+        if shift < tol:
+            break
+    inertia = float((get_sq_dists(points, centers).min(axis=1) * weights).sum())
+    return centers, inertia
+
+# bool (blocks_h, blocks_w) mask of the block_size blocks where more than block_thresh of the pixels differ from ref_frame
+# by more than pixel_thresh gray levels, grown by one block (changes reach into neighbouring blocks through the filters)
+def get_changed_blocks(frame, ref_frame, block_size=INCREMENTAL_BLOCK_SIZE, pixel_thresh=INCREMENTAL_PIXEL_THRESH,
+                       block_thresh=INCREMENTAL_BLOCK_THRESH):
+    h, w = frame.shape[:2]
+    diff = cv.cvtColor(cv.absdiff(frame, ref_frame), cv.COLOR_BGR2GRAY)
+    changed_pixels = cv.threshold(diff, pixel_thresh, 1.0, cv.THRESH_BINARY)[1].astype(np.float32)
+    blocks_h, blocks_w = -(-h // block_size), -(-w // block_size)
+    pad_h, pad_w = blocks_h * block_size - h, blocks_w * block_size - w
+    if pad_h > 0 or pad_w > 0:
+        changed_pixels = cv.copyMakeBorder(changed_pixels, 0, pad_h, 0, pad_w, cv.BORDER_CONSTANT, value=0)
+    changed_frac = changed_pixels.reshape(blocks_h, block_size, blocks_w, block_size).mean(axis=(1, 3))
+    changed = (changed_frac > block_thresh).astype(np.uint8)
+    return cv.dilate(changed, np.ones((3, 3), np.uint8)).astype(bool)
+
+# (y, x, h, w) pixel regions covering the changed blocks, one per horizontal run of changed blocks
+def get_block_runs(changed, block_size, h, w):
+    runs = []
+    for block_y, row in enumerate(changed):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], row.astype(np.int8), [0])))) # run starts/ends alternate
+        y = block_y * block_size
+        for start, end in zip(edges[::2], edges[1::2]):
+            x = start * block_size
+            runs.append((y, x, min(block_size, h - y), min(end * block_size, w) - x))
+    return runs
+
+# coarse normalized bgr histogram of a downsampled frame (cheap per frame scene signature)
+# soft binned so colours near a bin edge don't jump between bins as the frame moves: a fine histogram is counted
+# and each fine bin is split between its two nearest coarse bins (linear weights)
+def get_color_signature(frame):
+    h, w = frame.shape[:2]
+    scale = SCENE_SIG_SIDE / max(h, w)
+    if scale < 1:
+        frame = cv.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv.INTER_AREA)
+    fine_bins = SCENE_HIST_FINE_BINS
+    hist = cv.calcHist([frame], [0, 1, 2], None, [fine_bins, fine_bins, fine_bins], [0, 256, 0, 256, 0, 256])
+    weights = get_soft_bin_weights(SCENE_HIST_BINS, fine_bins)
+    hist = np.einsum("ai,bj,ck,ijk->abc", weights, weights, weights, hist, optimize=True)
+    return cv.normalize(hist, None, 1, 0, cv.NORM_L1)
+
+# (bins, fine_bins) share of each fine bin that goes to each coarse bin, columns sum to 1
+@lru_cache(maxsize=None)
+def get_soft_bin_weights(bins, fine_bins):
+    centers = (np.arange(fine_bins) + 0.5) * bins / fine_bins - 0.5 # fine bin centres in coarse bin units
+    lower = np.floor(centers).astype(np.int64)
+    frac = (centers - lower).astype(np.float32)
+    weights = np.zeros((bins, fine_bins), dtype=np.float32)
+    fine_idxs = np.arange(fine_bins)
+    np.add.at(weights, (np.clip(lower, 0, bins - 1), fine_idxs), 1 - frac)
+    np.add.at(weights, (np.clip(lower + 1, 0, bins - 1), fine_idxs), frac)
+    return weights
+
+# signature blended into the running one (weight -> share of sig)
+def blend_color_signature(running_sig, sig, weight=SCENE_SIG_SMOOTHING):
+    return cv.addWeighted(sig, weight, running_sig, 1 - weight, 0)
+
+# 0 -> same colours, 1 -> no colours in common
+def get_color_dist(sig_a, sig_b):
+    return cv.compareHist(sig_a, sig_b, cv.HISTCMP_BHATTACHARYYA)
+
 def get_k_range(frame):
     hsv = cv.cvtColor(frame, cv.COLOR_BGR2HSV)
     h, w = hsv.shape[:2]
@@ -102,7 +385,9 @@ def get_k_range(frame):
     hue_var = np.var(pixel_sample[:, 0])
     avg_sat = np.mean(pixel_sample[:, 1])
     unique_colors = len(np.unique(pixel_sample[:, 0]))
+    return get_k_range_from_stats(hue_var, avg_sat, unique_colors)
 
+def get_k_range_from_stats(hue_var, avg_sat, unique_colors):
     if avg_sat < 30:
         k_min = 4
         k_max = 8
@@ -116,4 +401,4 @@ def get_k_range(frame):
         k_min = 16
         k_max = 20
     
-    return k_min, k_max
\ No newline at end of file
+    return k_min, k_max
@@ -0,0 +1,275 @@
+import os
+import sys
+import stat
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2 as cv
+import numpy as np
+import mediafilter.filters as flt
+from mediafilter.constants import *
+from mediafilter import process_media as pm
+from mediafilter.session import FilterSession
+from mediafilter.metrics import JobReport, timed, count
+
+# live sources: read() -> next bgr frame (None once the stream ends), w/h/fps describe the stream
+
+# webcam / capture device index
+class CameraSource:
+    def __init__(self, index):
+        self.cv_cap = cv.VideoCapture(index)
+        if not self.cv_cap.isOpened():
+            raise ValueError(f"can't open camera {index}")
+        self.w = int(self.cv_cap.get(cv.CAP_PROP_FRAME_WIDTH))
+        self.h = int(self.cv_cap.get(cv.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.cv_cap.get(cv.CAP_PROP_FPS) or LIVE_DEFAULT_FPS
+
+    def read(self):
+        ret, frame = self.cv_cap.read()
+        return frame if ret else None
+
+    def close(self):
+        self.cv_cap.release()
+
+# raw bgr24 frames from stdin ("-") or a named pipe, e.g. ffmpeg -i ... -f rawvideo -pix_fmt bgr24 -
+class RawPipeSource:
+    def __init__(self, path, w, h, fps=LIVE_DEFAULT_FPS):
+        self.pipe = sys.stdin.buffer if path == "-" else open(path, "rb")
+        self.w, self.h, self.fps = w, h, fps
+
+    def read(self):
+        frame = np.empty((self.h, self.w, 3), dtype=np.uint8)
+        if not pm.read_exact(self.pipe, memoryview(frame).cast("B")):
+            return None
+        return frame
+
+    def close(self):
+        if self.pipe is not sys.stdin.buffer:
+            self.pipe.close()
+
+# local file played back at real time pace (frames are released at their timestamps, like a camera would)
+class FilePlaybackSource:
+    def __init__(self, path):
+        self.cv_cap = cv.VideoCapture(path)
+        if not self.cv_cap.isOpened():
+            raise ValueError(f"can't open {path}")
+        self.w = int(self.cv_cap.get(cv.CAP_PROP_FRAME_WIDTH))
+        self.h = int(self.cv_cap.get(cv.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.cv_cap.get(cv.CAP_PROP_FPS) or LIVE_DEFAULT_FPS
+        self.frame_idx = 0
+        self.start_time = None
+
+    def read(self):
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        ret, frame = self.cv_cap.read()
+        if not ret:
+            return None
+        wait = self.start_time + self.frame_idx / self.fps - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        self.frame_idx += 1
+        return frame
+
+    def close(self):
+        self.cv_cap.release()
+
+# SOURCE argument -> source: digits -> camera, "-" or a fifo -> raw bgr24 (needs size), anything else -> file playback
+def open_source(source, size=None, fps=LIVE_DEFAULT_FPS):
+    if source.isdigit():
+        return CameraSource(int(source))
+    if source == "-" or stat.S_ISFIFO(os.stat(source).st_mode):
+        if size is None:
+            raise ValueError("raw pipe sources need --size WxH")
+        return RawPipeSource(source, size[0], size[1], fps)
+    return FilePlaybackSource(source)
+
+# single slot between the capture thread and the filter loop, a new frame replaces one that wasn't taken yet
+# so the filter loop always gets the newest frame and never works through a backlog
+class LatestFrame:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.item = None
+        self.closed = False
+        self.num_dropped = 0
+
+    def put(self, frame, capture_time, seq):
+        with self.cond:
+            if self.item is not None:
+                self.num_dropped += 1
+            self.item = (frame, capture_time, seq)
+            self.cond.notify()
+
+    # (frame, capture_time, seq), None once closed and empty
+    def get(self):
+        with self.cond:
+            while self.item is None and not self.closed:
+                self.cond.wait()
+            item, self.item = self.item, None
+            return item
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+# live sinks: write(frame) for every output frame, close() at the end
+
+# raw bgr24 frames to stdout ("-") or a named pipe, e.g. | ffplay -f rawvideo -pix_fmt bgr24 -video_size WxH -
+class PipeSink:
+    def __init__(self, path):
+        self.pipe = sys.__stdout__.buffer if path == "-" else open(path, "wb") # __stdout__ -> still stdout when logs are redirected
+
+    def start(self, w, h, fps):
+        pass
+
+    def write(self, frame):
+        self.pipe.write(memoryview(np.ascontiguousarray(frame, dtype=np.uint8)))
+
+    def close(self):
+        self.pipe.flush()
+        if self.pipe is not sys.__stdout__.buffer:
+            self.pipe.close()
+
+# fragmented mp4 segments of segment_secs each in output_dir (same format as process_vid_stream)
+class SegmentSink:
+    def __init__(self, output_dir, segment_secs=STREAM_SEGMENT_SECS):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.segment_secs = segment_secs
+        self.segment_paths = []
+        self.ffmpeg_process = None
+
+    def start(self, w, h, fps):
+        self.w, self.h, self.fps = w, h, fps
+        self.segment_len = max(1, int(round(self.segment_secs * fps)))
+
+    def write(self, frame):
+        if self.ffmpeg_process is None:
+            self.segment_paths.append(os.path.join(self.output_dir, f"segment_{len(self.segment_paths):04d}{STREAM_SEGMENT_EXT}"))
+            self.ffmpeg_process = pm.start_ffmpeg_process(self.segment_paths[-1], self.w, self.h, self.fps, movflags=STREAM_MOVFLAGS)
+            self.segment_frame_count = 0
+        self.ffmpeg_process.stdin.write(memoryview(np.ascontiguousarray(frame, dtype=np.uint8)))
+        self.segment_frame_count += 1
+        if self.segment_frame_count == self.segment_len:
+            self.close()
+
+    def close(self):
+        if self.ffmpeg_process is not None:
+            pm.finish_ffmpeg_process(self.ffmpeg_process)
+            self.ffmpeg_process = None
+            print(f"segment ready: {self.segment_paths[-1]}")
+
+# filter a live source into a sink with bounded latency, returns the report
+# a capture thread keeps only the newest frame (older untaken frames are dropped), frames that waited longer than
+# max_latency are dropped before filtering, each filtered frame is repeated over the frames dropped before it so the
+# output keeps the source frame rate. palette retrains / partial fits run in a background thread (see update_palette)
+# latency (report frame latencies) is end to end: capture -> written to the sink
+def run_live(source, sink, filter_type, bg_color="", preset=DEFAULT_PRESET, max_latency=LIVE_MAX_LATENCY, report=None, max_frames=None,
+             stop_event=None):
+    report = report if report is not None else JobReport(filter=filter_type, preset=preset, mode="live")
+    session = FilterSession(LIVE_BUFFER_POOL_SIZE, report, preset)
+    session.palette_worker = ThreadPoolExecutor(max_workers=1)
+    w, h = pm.get_vid_dims(source.w, source.h, session.preset["video_max_side"])
+    sink.start(w, h, source.fps)
+    slot = LatestFrame()
+    stop_event = stop_event if stop_event is not None else threading.Event()
+
+    def capture():
+        seq = 0
+        try:
+            while not stop_event.is_set() and (max_frames is None or seq < max_frames):
+                frame = source.read()
+                if frame is None:
+                    break
+                slot.put(frame, time.perf_counter(), seq)
+                seq += 1
+        finally:
+            slot.close()
+
+    capture_thread = threading.Thread(target=capture, daemon=True)
+    capture_thread.start()
+    print(f"Live {filter_type} {w}x{h} @ {source.fps:.1f}fps, max latency {max_latency * 1000:.0f}ms")
+
+    last_seq = -1
+    try:
+        while True:
+            item = slot.get()
+            if item is None:
+                break
+            frame, capture_time, seq = item
+            if time.perf_counter() - capture_time > max_latency:
+                count(report, "frames_late")
+                continue
+            if (w != frame.shape[1] or h != frame.shape[0]):
+                with timed(report, "resize"):
+                    frame = cv.resize(frame, (w, h), interpolation=cv.INTER_AREA)
+            if filter_type == "Sketch":
+                processed_frame = flt.get_sketch_frame(frame, bg_color, for_video=True, session=session)
+            else:
+                processed_frame = flt.get_cartoon_frame(frame, seq, for_video=True, session=session)
+            with timed(report, "encode_write"):
+                for _ in range(seq - last_seq): # dropped frames repeat the newest output
+                    sink.write(processed_frame)
+            latency = time.perf_counter() - capture_time
+            report.add_frame_latency(latency)
+            if latency > max_latency:
+                count(report, "latency_overruns")
+            count(report, "frames")
+            last_seq = seq
+    finally:
+        stop_event.set()
+        capture_thread.join()
+        session.palette_worker.shutdown(wait=True)
+        sink.close()
+        source.close()
+
+    count(report, "frames_dropped", slot.num_dropped + report.counters.get("frames_late", 0))
+    report.finish()
+    return report
+
+def parse_size(size):
+    w, h = size.lower().split("x")
+    return int(w), int(h)
+
+# python -m mediafilter.live SOURCE -f Sketch|Cartoon [-o -|FIFO | --segment-dir DIR]
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mediafilter.live", description="Filter a camera, pipe or file in real time.")
+    parser.add_argument("source", help="camera index, - (raw bgr24 on stdin), a named pipe, or a file played back at real time pace")
+    parser.add_argument("-f", "--filter", dest="filter_type", choices=["Sketch", "Cartoon"], required=True)
+    parser.add_argument("--bg", dest="bg_color", choices=["Black", "White"], default="Black", help="sketch background color")
+    parser.add_argument("-p", "--preset", choices=list(PRESETS), default="fast", help="speed/quality tier")
+    parser.add_argument("--size", type=parse_size, help="WxH of raw pipe sources")
+    parser.add_argument("--fps", type=float, default=LIVE_DEFAULT_FPS, help="frame rate of raw pipe sources")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("-o", "--output", help="- (raw bgr24 on stdout) or a named pipe")
+    output.add_argument("--segment-dir", help="write fragmented mp4 segments here")
+    parser.add_argument("--segment-secs", type=float, default=STREAM_SEGMENT_SECS)
+    parser.add_argument("--max-latency", type=float, default=LIVE_MAX_LATENCY, help="secs before a frame is dropped")
+    parser.add_argument("--max-frames", type=int, help="stop after this many source frames")
+    parser.add_argument("--report", help="write the timing report here")
+    parser.add_argument("--report-format", choices=["json", "prometheus"], default="json")
+    args = parser.parse_args(argv)
+
+    if args.output == "-":
+        sys.stdout = sys.stderr # frames go to stdout, logs don't
+    bg_color = args.bg_color if args.filter_type == "Sketch" else ""
+    source = open_source(args.source, args.size, args.fps)
+    sink = PipeSink(args.output) if args.output else SegmentSink(args.segment_dir, args.segment_secs)
+    try:
+        report = run_live(source, sink, args.filter_type, bg_color, args.preset, args.max_latency, max_frames=args.max_frames)
+    except KeyboardInterrupt:
+        return 0
+
+    latency = report.get_latency_percentiles()
+    frames, dropped = report.counters.get("frames", 0), report.counters.get("frames_dropped", 0)
+    if frames:
+        print(f"LIVE DONE: {frames} frames filtered, {dropped} dropped, latency p50 {latency['p50'] * 1000:.0f}ms "
+              f"p95 {latency['p95'] * 1000:.0f}ms, {report.counters.get('latency_overruns', 0)} over {args.max_latency * 1000:.0f}ms")
+    if args.report:
+        report.write(args.report, args.report_format)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2 as cv
+from mediafilter.constants import *
+
+class MediaPoolEmpty(Exception):
+    pass
+
+# providers return search results in the pexels api format:
+# photos -> [{"src": {size: url}}], videos -> [{"duration": secs, "video_files": [{"width", "height", "link"}]}]
+# client is created on the first search so building the provider (at app import) costs nothing
+class PexelsProvider:
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.client = None
+        self.client_lock = threading.Lock()
+
+    def get_client(self):
+        with self.client_lock:
+            if self.client is None:
+                from pexelsapi.pexels import Pexels
+                self.client = Pexels(self.api_key)
+            return self.client
+
+    def search_photos(self, query, page, per_page):
+        return self.get_client().search_photos(query=query, per_page=per_page, page=page).get("photos") or []
+
+    def search_videos(self, query, page, per_page):
+        return self.get_client().search_videos(query=query, per_page=per_page, page=page).get("videos") or []
+
+# stand-in for pexels that serves files from a local directory (every query/page returns all of them)
+class LocalProvider:
+    def __init__(self, media_dir):
+        self.media_paths = sorted(os.path.join(media_dir, f) for f in os.listdir(media_dir))
+
+    def search_photos(self, query, page, per_page):
+        img_paths = [p for p in self.media_paths if os.path.splitext(p)[1].lower() in IMAGE_EXTENSIONS]
+        return [{"src": {"large": p, "original": p}} for p in img_paths[:per_page]]
+
+    def search_videos(self, query, page, per_page):
+        videos = []
+        for vid_path in self.media_paths:
+            if os.path.splitext(vid_path)[1].lower() not in VIDEO_EXTENSIONS:
+                continue
+            cv_cap = cv.VideoCapture(vid_path)
+            w, h = int(cv_cap.get(cv.CAP_PROP_FRAME_WIDTH)), int(cv_cap.get(cv.CAP_PROP_FRAME_HEIGHT))
+            duration = cv_cap.get(cv.CAP_PROP_FRAME_COUNT) / (cv_cap.get(cv.CAP_PROP_FPS) or MAX_FPS)
+            cv_cap.release()
+            videos.append({"duration": duration, "video_files": [{"width": w, "height": h, "link": vid_path}]})
+        return videos[:per_page]
+
+# bounded set of ready to use media urls, refilled in the background by fetching search pages concurrently
+# fetch_page(query, page) -> list of urls (already filtered), called from worker threads
+class MediaPool:
+    def __init__(self, fetch_page, queries, max_page, max_size=MEDIA_POOL_SIZE, refill_at=MEDIA_POOL_REFILL_AT,
+                 num_fetchers=MEDIA_POOL_FETCHERS):
+        self.fetch_page = fetch_page
+        self.queries = queries
+        self.max_page = max_page
+        self.max_size = max_size
+        self.refill_at = refill_at
+        self.urls = []
+        self.num_pending = 0
+        self.last_error = None
+        self.ready = threading.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=num_fetchers, thread_name_prefix="mf-media-pool")
+
+    # random url from the pool (waits for a fetch if it is empty), raises MediaPoolEmpty if nothing arrives in time
+    def get(self, timeout=MEDIA_POOL_WAIT_SECS):
+        with self.ready:
+            self.refill()
+            if not self.ready.wait_for(lambda: len(self.urls) > 0 or self.num_pending == 0, timeout=timeout) or len(self.urls) == 0:
+                raise MediaPoolEmpty(f"no media available ({self.last_error or 'searches returned nothing usable'})")
+            url = self.urls.pop(random.randrange(len(self.urls)))
+            self.refill()
+            return url
+
+    # start one fetch per query (random page) if the pool is running low and none are in flight
+    def refill(self):
+        with self.ready:
+            if len(self.urls) > self.refill_at or self.num_pending > 0:
+                return
+            for query in self.queries:
+                self.num_pending += 1
+                self.executor.submit(self.fetch, query, random.randint(1, self.max_page))
+
+    def fetch(self, query, page):
+        error = None
+        try:
+            new_urls = self.fetch_page(query, page)
+        except Exception as e:
+            new_urls = []
+            error = e
+        with self.ready:
+            self.last_error = error # a fetch that works clears an earlier failure
+            self.urls.extend(new_urls)
+            del self.urls[:max(0, len(self.urls) - self.max_size)] # drop oldest
+            self.num_pending -= 1
+            self.ready.notify_all()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# urls of one page of photo results
+def get_photo_urls(provider, query, page, per_page, img_size):
+    return [photo["src"][img_size] for photo in provider.search_photos(query, page, per_page)]
+
+# urls of one page of video results with a duration in [min_dur, max_dur] and exactly target_res pixels
+def get_video_urls(provider, query, page, per_page, min_dur, max_dur, target_res):
+    urls = []
+    for video in provider.search_videos(query, page, per_page):
+        if video["duration"] < min_dur or video["duration"] > max_dur:
+            continue
+        for video_file in video["video_files"]:
+            if video_file["width"] * video_file["height"] == target_res:
+                urls.append(video_file["link"])
+    return urls
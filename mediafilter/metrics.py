@@ -0,0 +1,133 @@
+import json
+import time
+import threading
+import contextlib
+import numpy as np
+
+NULL_TIMER = contextlib.nullcontext() # shared no-op timer used when instrumentation is off
+
+# per-job timings and counters (stage totals, frame latency, dropped frames, retrains)
+# thread safe so the pipelined decoder/filter/encoder threads can share one report
+class JobReport:
+    def __init__(self, **labels):
+        self.labels = labels # e.g. job=<input file>, filter=<type>, exported with every metric
+        self.stage_secs = {}
+        self.stage_calls = {}
+        self.counters = {}
+        self.frame_latencies = []
+        self.info = {} # choices made during the job (e.g. deadline controller levels), json only
+        self.start_time = time.perf_counter()
+        self.wall_secs = None
+        self.lock = threading.Lock()
+
+    # lock can't be pickled (reports are sent back from worker processes)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - start)
+
+    def add_stage_time(self, name, secs, calls=1):
+        with self.lock:
+            self.stage_secs[name] = self.stage_secs.get(name, 0.0) + secs
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + calls
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_count(self, name, n):
+        with self.lock:
+            self.counters[name] = n
+
+    def set_info(self, name, value):
+        with self.lock:
+            self.info[name] = value
+
+    def add_frame_latency(self, secs):
+        with self.lock:
+            self.frame_latencies.append(secs)
+
+    def finish(self):
+        self.wall_secs = time.perf_counter() - self.start_time
+
+    # add timings from a report filled in another process (video segments)
+    def merge(self, other):
+        with self.lock:
+            for name, secs in other.stage_secs.items():
+                self.stage_secs[name] = self.stage_secs.get(name, 0.0) + secs
+                self.stage_calls[name] = self.stage_calls.get(name, 0) + other.stage_calls[name]
+            for name, n in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            self.frame_latencies.extend(other.frame_latencies)
+
+    def get_latency_percentiles(self):
+        if len(self.frame_latencies) == 0:
+            return {"p50": None, "p95": None}
+        p50, p95 = np.percentile(self.frame_latencies, [50, 95])
+        return {"p50": float(p50), "p95": float(p95)}
+
+    def to_dict(self):
+        return {
+            "labels": self.labels,
+            "wall_secs": self.wall_secs,
+            "stages": {name: {"secs": secs, "calls": self.stage_calls[name]} for name, secs in sorted(self.stage_secs.items())},
+            "counters": dict(sorted(self.counters.items())),
+            "frame_latency_secs": self.get_latency_percentiles(),
+            "info": self.info,
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    # prometheus text exposition format
+    def to_prometheus(self, prefix="mediafilter"):
+        def fmt_labels(**extra):
+            labels = {**self.labels, **extra}
+            if len(labels) == 0:
+                return ""
+            escaped = {k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for k, v in labels.items()}
+            return "{" + ",".join(f'{k}="{v}"' for k, v in escaped.items()) + "}"
+
+        lines = [f"# TYPE {prefix}_stage_seconds_total counter"]
+        lines += [f"{prefix}_stage_seconds_total{fmt_labels(stage=name)} {secs:.6f}" for name, secs in sorted(self.stage_secs.items())]
+        lines.append(f"# TYPE {prefix}_stage_calls_total counter")
+        lines += [f"{prefix}_stage_calls_total{fmt_labels(stage=name)} {calls}" for name, calls in sorted(self.stage_calls.items())]
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total{fmt_labels()} {n}")
+        lines.append(f"# TYPE {prefix}_frame_latency_seconds summary")
+        for quantile, secs in zip(["0.5", "0.95"], self.get_latency_percentiles().values()):
+            if secs is not None:
+                lines.append(f"{prefix}_frame_latency_seconds{fmt_labels(quantile=quantile)} {secs:.6f}")
+        lines.append(f"{prefix}_frame_latency_seconds_count{fmt_labels()} {len(self.frame_latencies)}")
+        if self.wall_secs is not None:
+            lines.append(f"# TYPE {prefix}_job_seconds gauge")
+            lines.append(f"{prefix}_job_seconds{fmt_labels()} {self.wall_secs:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, fmt="json"):
+        with open(path, "w") as f:
+            f.write(self.to_prometheus() if fmt == "prometheus" else self.to_json())
+
+# timer for a stage, no-op when report is None (instrumentation off)
+def timed(report, name):
+    if report is None:
+        return NULL_TIMER
+    return report.stage(name)
+
+# count without checking for None at every call site
+def count(report, name, n=1):
+    if report is not None:
+        report.count(name, n)
@@ -0,0 +1,79 @@
+import queue
+import threading
+from mediafilter.constants import *
+
+# put item in queue without blocking forever if another stage failed
+def put_item(q, item, stop_event):
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+# get item from queue (None if another stage failed)
+def get_item(q, stop_event):
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+# decode -> filter -> encode with each stage running at the same time
+# frames: iterable of (frame_idx, frame), filter_frame(frame, frame_idx), write_frame(processed_frame)
+def run_pipeline(frames, filter_frame, write_frame, queue_size=PIPELINE_QUEUE_SIZE):
+    decoded = queue.Queue(maxsize=queue_size) # bounded so a slow stage holds back the faster ones
+    filtered = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    errors = []
+
+    def decode():
+        try:
+            for item in frames:
+                if not put_item(decoded, item, stop_event):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            put_item(decoded, None, stop_event) # end of stream
+
+    def encode():
+        try:
+            while True:
+                processed_frame = get_item(filtered, stop_event)
+                if processed_frame is None:
+                    break
+                write_frame(processed_frame)
+        except BaseException as e:
+            errors.append(e)
+            stop_event.set()
+
+    decode_thread = threading.Thread(target=decode, name="mf-decode", daemon=True)
+    encode_thread = threading.Thread(target=encode, name="mf-encode", daemon=True)
+    decode_thread.start()
+    encode_thread.start()
+
+    # filter stage runs in the calling thread (single stage so frame order is kept)
+    try:
+        while True:
+            item = get_item(decoded, stop_event)
+            if item is None:
+                break
+            frame_idx, frame = item
+            processed_frame = filter_frame(frame, frame_idx)
+            if not put_item(filtered, processed_frame, stop_event):
+                break
+    except BaseException as e:
+        errors.append(e)
+        stop_event.set()
+    finally:
+        put_item(filtered, None, stop_event)
+        encode_thread.join()
+        stop_event.set() # release decoder if it is still blocked on a full queue
+        decode_thread.join()
+
+    if errors:
+        raise errors[0]
@@ -1,40 +1,519 @@
 import os
+import shutil
+import tempfile
+import time
+import pickle
+import hashlib
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import cv2 as cv
+import numpy as np
 import mediafilter.filters as flt
-import ffmpeg
 from mediafilter.constants import *
-import mediafilter.filters_utils as fu
+from mediafilter.session import FilterSession, get_preset
+from mediafilter.pipeline import run_pipeline
+from mediafilter.metrics import JobReport, timed, count
+from mediafilter.deadline import DeadlineController
 from datetime import datetime, timezone, timedelta
 
-def process_img(img_input_path, img_output_dir, filter_type, bg_color=""):
-    img_input = cv.imread(img_input_path)
-    if filter_type == "Sketch":
-        img_output = flt.get_sketch_frame(img_input, bg_color, for_video=False)
+# ffmpeg exited with an error while encoding or decoding (message ends with its stderr)
+class FfmpegError(Exception):
+    pass
+
+# cache -> ResultCache, identical requests are served from it (img_output_dir None -> output only kept in cache)
+# report -> metrics.JobReport filled with stage timings (None -> no instrumentation)
+# preset -> speed/quality tier from PRESETS ("fast", "balanced", "quality")
+# full_res -> keep the input resolution (filtered in tiles) instead of shrinking to the preset's max side
+def process_img(img_input_path, img_output_dir, filter_type, bg_color="", cache=None, report=None, preset=DEFAULT_PRESET, full_res=False):
+    if cache is not None:
+        return run_cached(cache, img_input_path, img_output_dir, filter_type, bg_color, OUTPUT_IMAGE_EXT,
+                          lambda output_dir: process_img(img_input_path, output_dir, filter_type, bg_color, report=report, preset=preset, full_res=full_res),
+                          report=report, preset=preset, full_res=full_res)
+
+    session = FilterSession(report=report, preset=preset)
+    with timed(report, "decode"):
+        img_input = cv.imread(img_input_path)
+    filter_start = time.perf_counter()
+    if full_res:
+        img_output = flt.get_tiled_frame(img_input, filter_type, bg_color, session=session)
+    elif filter_type == "Sketch":
+        img_output = flt.get_sketch_frame(img_input, bg_color, for_video=False, session=session)
     else:
-        img_output = flt.get_cartoon_frame(img_input, frame_idx=0, for_video=False)
+        img_output = flt.get_cartoon_frame(img_input, frame_idx=0, for_video=False, session=session)
+    if report is not None:
+        report.add_frame_latency(time.perf_counter() - filter_start)
+        report.count("frames")
     
     img_output_path = get_output_path(img_input_path, img_output_dir, filter_type, bg_color)
-    cv.imwrite(img_output_path, img_output)
+    with timed(report, "encode_write"):
+        cv.imwrite(img_output_path, img_output)
+    if report is not None:
+        report.finish()
 
     est_time = get_time()
     dl_log = f"IMAGE SAVED TO: {img_output_path} AT: {est_time}"
     #print("Image saved to ", img_output_path)
     print(dl_log)
-    flt.kmeans = None
-    fu.edge_buffer.clear()
     return img_output_path
 
-def process_vid(vid_input_path, vid_output_dir, filter_type, bg_color=""):
+# time_budget -> seconds the job should finish in, quality is lowered while filtering if needed (deadline.DeadlineController)
+# checkpoint_dir -> encode CHECKPOINT_SEGMENT_SECS pieces and save progress there after each one, so running the same job
+# again after a crash resumes from the last finished piece (see process_vid_checkpointed)
+def process_vid(vid_input_path, vid_output_dir, filter_type, bg_color="", pipelined=False, num_workers=1, decoder=VIDEO_DECODER, cache=None,
+                report=None, preset=DEFAULT_PRESET, time_budget=None, checkpoint_dir=None):
+    if time_budget is not None and num_workers > 1:
+        raise ValueError("time_budget needs num_workers=1 (segments filtered in other processes can't be adjusted)")
+    if checkpoint_dir is not None and (num_workers > 1 or time_budget is not None):
+        raise ValueError("checkpoint_dir needs num_workers=1 and no time_budget")
+    if cache is not None:
+        return run_cached(cache, vid_input_path, vid_output_dir, filter_type, bg_color, OUTPUT_VIDEO_EXT,
+                          lambda output_dir: process_vid(vid_input_path, output_dir, filter_type, bg_color, pipelined, num_workers, decoder,
+                                                         report=report, preset=preset, time_budget=time_budget, checkpoint_dir=checkpoint_dir),
+                          report=report, preset=preset, time_budget=time_budget, num_workers=num_workers, decoder=decoder)
+
     # open input video file
+    session = FilterSession(VIDEO_BUFFER_POOL_SIZE, report, preset)
+    cv_cap, w, h, input_fps, output_fps, total_frames = open_vid(vid_input_path, session.preset["video_max_side"])
+    frame_interval = input_fps / output_fps
+
+    # build output file (force output ext to .mp4)
+    vid_output_path = get_output_path(vid_input_path, vid_output_dir, filter_type, bg_color)
+
+    print("Processing...")
+
+    if num_workers > 1 and total_frames > 0:
+        # split into time segments that are filtered in separate processes (opencv decoding, needs frame accurate seeking)
+        cv_cap.release()
+        process_vid_parallel(vid_input_path, vid_output_path, filter_type, bg_color, w, h, output_fps,
+                             frame_interval, total_frames, num_workers, pipelined, report, preset)
+    elif checkpoint_dir is not None and total_frames > 0:
+        try:
+            process_vid_checkpointed(vid_input_path, vid_output_path, filter_type, bg_color, cv_cap, w, h, output_fps,
+                                     frame_interval, total_frames, checkpoint_dir, session, pipelined)
+        finally:
+            cv_cap.release()
+    else:
+        controller = None
+        if time_budget is not None:
+            controller = DeadlineController(time_budget, int(total_frames / frame_interval), session)
+        # start ffmpeg process async to receive raw frames
+        ffmpeg_process = start_ffmpeg_process(vid_output_path, w, h, output_fps)
+        try:
+            frames = get_vid_frames(vid_input_path, cv_cap, w, h, input_fps, output_fps, decoder, report)
+            encode_frames(frames, ffmpeg_process, filter_type, bg_color, session, pipelined, controller)
+        finally:
+            cv_cap.release()
+            with timed(report, "encode_flush"):
+                finish_ffmpeg_process(ffmpeg_process)
+        if controller is not None:
+            controller.finish(report)
+    if report is not None:
+        report.finish()
+
+    est_time = get_time()
+    dl_log = f"VIDEO SAVED TO: {vid_output_path} AT: {est_time}"
+    print(dl_log)
+
+    #print("Video saved to ", vid_output_path)
+    return vid_output_path
+
+# generator version of process_vid that yields each short encoded segment (fragmented mp4) as soon as it is done
+# so playback can start before the whole video is processed, returns path of full mp4 (StopIteration.value)
+# segments_dir -> directory the segments are written to, owned by the caller (not deleted here, for consumers in another
+# process that read segments after the generator has finished), None -> temp dir deleted when the generator ends
+def process_vid_stream(vid_input_path, vid_output_dir, filter_type, bg_color="", decoder=VIDEO_DECODER, segment_secs=STREAM_SEGMENT_SECS, cache=None,
+                       report=None, preset=DEFAULT_PRESET, segments_dir=None):
+    if cache is not None:
+        # cache hit -> no segments, just the cached video
+        cache_key = cache.get_key(vid_input_path, filter_type, bg_color, preset=preset)
+        cached_path = get_cached_output(cache, cache_key, vid_input_path, vid_output_dir, filter_type, bg_color, OUTPUT_VIDEO_EXT, report)
+        if cached_path is not None:
+            return cached_path
+        tmp_dir = cache.make_tmp_dir() if vid_output_dir is None else None
+        try:
+            vid_output_path = yield from process_vid_stream(vid_input_path, vid_output_dir or tmp_dir, filter_type, bg_color, decoder, segment_secs,
+                                                            report=report, preset=preset, segments_dir=segments_dir)
+            return cache.put(cache_key, vid_output_path, move=tmp_dir is not None)
+        finally:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    session = FilterSession(VIDEO_BUFFER_POOL_SIZE, report, preset)
+    cv_cap, w, h, input_fps, output_fps, total_frames = open_vid(vid_input_path, session.preset["video_max_side"])
+    vid_output_path = get_output_path(vid_input_path, vid_output_dir, filter_type, bg_color)
+    segment_len = max(1, int(round(segment_secs * output_fps)))
+
+    print("Processing...")
+
+    owns_segments_dir = segments_dir is None
+    if owns_segments_dir:
+        segments_dir = tempfile.mkdtemp(dir=vid_output_dir)
+    segment_paths = []
+    ffmpeg_process = None
+    try:
+        frames = get_vid_frames(vid_input_path, cv_cap, w, h, input_fps, output_fps, decoder, report)
+        for frame_idx, frame in frames:
+            if ffmpeg_process is None:
+                segment_paths.append(os.path.join(segments_dir, f"segment_{len(segment_paths):04d}{STREAM_SEGMENT_EXT}"))
+                ffmpeg_process = start_ffmpeg_process(segment_paths[-1], w, h, output_fps, movflags=STREAM_MOVFLAGS)
+                segment_frame_count = 0
+
+            processed_frame = filter_vid_frame(frame, frame_idx, filter_type, bg_color, session)
+            with timed(report, "encode_write"):
+                ffmpeg_process.stdin.write(memoryview(np.ascontiguousarray(processed_frame, dtype=np.uint8)))
+            count(report, "frames")
+            segment_frame_count += 1
+
+            if segment_frame_count == segment_len:
+                with timed(report, "encode_flush"):
+                    finish_ffmpeg_process(ffmpeg_process)
+                ffmpeg_process = None
+                yield segment_paths[-1]
+
+        if ffmpeg_process is not None:
+            with timed(report, "encode_flush"):
+                finish_ffmpeg_process(ffmpeg_process)
+            ffmpeg_process = None
+            yield segment_paths[-1]
+
+        # join segments into the downloadable mp4
+        with timed(report, "concat"):
+            concat_vids(segment_paths, vid_output_path)
+    finally:
+        cv_cap.release()
+        if ffmpeg_process is not None:
+            finish_ffmpeg_process(ffmpeg_process)
+        if owns_segments_dir:
+            shutil.rmtree(segments_dir, ignore_errors=True)
+
+    if report is not None:
+        report.finish()
+    est_time = get_time()
+    dl_log = f"VIDEO SAVED TO: {vid_output_path} AT: {est_time}"
+    print(dl_log)
+    return vid_output_path
+
+# several outputs of one image, variants -> list of (filter_type, bg_color) e.g. [("Sketch", "White"), ("Sketch", "Black"), ("Cartoon", "")]
+# image is decoded + resized once and sketch edges are shared, returns output paths in variant order
+def process_img_variants(img_input_path, img_output_dir, variants, report=None, preset=DEFAULT_PRESET):
+    sessions = get_variant_sessions(variants, 0, report, preset)
+    with timed(report, "decode"):
+        img_input = cv.imread(img_input_path)
+    filter_start = time.perf_counter()
+    img_outputs = flt.get_variant_frames(img_input, 0, variants, for_video=False, sessions=sessions)
+    if report is not None:
+        report.add_frame_latency(time.perf_counter() - filter_start)
+        report.count("frames")
+
+    img_output_paths = []
+    for (filter_type, bg_color), img_output in zip(variants, img_outputs):
+        img_output_path = get_output_path(img_input_path, img_output_dir, filter_type, bg_color)
+        with timed(report, "encode_write"):
+            cv.imwrite(img_output_path, img_output)
+        print(f"IMAGE SAVED TO: {img_output_path} AT: {get_time()}")
+        img_output_paths.append(img_output_path)
+    if report is not None:
+        report.finish()
+    return img_output_paths
+
+# several outputs of one video from a single decode (see process_img_variants), each variant has its own
+# ffmpeg process and the frames of every variant are written to them at the same time, returns output paths in variant order
+def process_vid_variants(vid_input_path, vid_output_dir, variants, pipelined=False, decoder=VIDEO_DECODER, report=None, preset=DEFAULT_PRESET):
+    sessions = get_variant_sessions(variants, VIDEO_BUFFER_POOL_SIZE, report, preset)
+    cv_cap, w, h, input_fps, output_fps, total_frames = open_vid(vid_input_path, get_preset(preset)["video_max_side"])
+    vid_output_paths = [get_output_path(vid_input_path, vid_output_dir, filter_type, bg_color) for filter_type, bg_color in variants]
+
+    print("Processing...")
+
+    ffmpeg_processes = []
+    try:
+        for vid_output_path in vid_output_paths:
+            ffmpeg_processes.append(start_ffmpeg_process(vid_output_path, w, h, output_fps))
+        frames = get_vid_frames(vid_input_path, cv_cap, w, h, input_fps, output_fps, decoder, report)
+        encode_variant_frames(frames, ffmpeg_processes, variants, sessions, report, pipelined)
+    finally:
+        cv_cap.release()
+        with timed(report, "encode_flush"):
+            errors = []
+            for ffmpeg_process in ffmpeg_processes:
+                try:
+                    finish_ffmpeg_process(ffmpeg_process)
+                except FfmpegError as e:
+                    errors.append(e)
+            if errors:
+                raise errors[0]
+    if report is not None:
+        report.finish()
+
+    for vid_output_path in vid_output_paths:
+        print(f"VIDEO SAVED TO: {vid_output_path} AT: {get_time()}")
+    return vid_output_paths
+
+# one session per filter type, the sketch session's output buffers are shared by all sketch variants
+def get_variant_sessions(variants, buffer_pool_size, report, preset):
+    if len(variants) == 0:
+        raise ValueError("no output variants given")
+    num_sketch_variants = sum(filter_type == "Sketch" for filter_type, _ in variants)
+    return {filter_type: FilterSession(buffer_pool_size * max(1, num_sketch_variants) if filter_type == "Sketch" else buffer_pool_size, report, preset)
+            for filter_type, _ in variants}
+
+# like encode_frames but every decoded frame is filtered into one frame per variant, written to that variant's ffmpeg process
+def encode_variant_frames(frames, ffmpeg_processes, variants, sessions, report=None, pipelined=False):
+    frame_count = 0
+
+    def filter_frame(frame, frame_idx):
+        filter_start = time.perf_counter()
+        variant_frames = flt.get_variant_frames(frame, frame_idx, variants, for_video=True, sessions=sessions)
+        if report is not None:
+            report.add_frame_latency(time.perf_counter() - filter_start)
+        return variant_frames
+
+    def write_variant_frame(ffmpeg_process, processed_frame):
+        ffmpeg_process.stdin.write(memoryview(np.ascontiguousarray(processed_frame, dtype=np.uint8)))
+
+    # pipe writes release the gil, so the encoders are fed in parallel
+    with ThreadPoolExecutor(max_workers=len(ffmpeg_processes), thread_name_prefix="mf-variant-write") as write_pool:
+        def write_frames(variant_frames):
+            nonlocal frame_count
+            with timed(report, "encode_write"):
+                for write_future in [write_pool.submit(write_variant_frame, p, f) for p, f in zip(ffmpeg_processes, variant_frames)]:
+                    write_future.result()
+            frame_count += 1
+
+        if pipelined:
+            run_pipeline(frames, filter_frame, write_frames)
+        else:
+            for frame_idx, frame in frames:
+                write_frames(filter_frame(frame, frame_idx))
+    count(report, "frames", frame_count)
+    return frame_count
+
+# returns (cv_cap, w, h, input_fps, output_fps, total_frames), w/h already reduced to max_side
+def open_vid(vid_input_path, max_side=VIDEO_MAX_SIDE):
     cv_cap = cv.VideoCapture(vid_input_path)
     orig_w = int(cv_cap.get(cv.CAP_PROP_FRAME_WIDTH))
     orig_h = int(cv_cap.get(cv.CAP_PROP_FRAME_HEIGHT))
     input_fps = cv_cap.get(cv.CAP_PROP_FPS) or MAX_FPS
     output_fps = min(input_fps, MAX_FPS)
+    total_frames = int(cv_cap.get(cv.CAP_PROP_FRAME_COUNT))
 
     # reduce video dimensions if needed 
-    if max(orig_h, orig_w) > VIDEO_MAX_SIDE:
-        scale = VIDEO_MAX_SIDE / max(orig_h, orig_w)
+    w, h = get_vid_dims(orig_w, orig_h, max_side)
+    return cv_cap, w, h, input_fps, output_fps, total_frames
+
+# iterable of (frame_idx, frame) at output fps and size
+def get_vid_frames(vid_input_path, cv_cap, w, h, input_fps, output_fps, decoder=VIDEO_DECODER, report=None):
+    if decoder == "ffmpeg":
+        total_frames = int(cv_cap.get(cv.CAP_PROP_FRAME_COUNT))
+        cv_cap.release()
+        return read_vid_frames_ffmpeg(vid_input_path, w, h, input_fps, output_fps, report, total_frames)
+    return read_vid_frames(cv_cap, w, h, input_fps / output_fps, report=report)
+
+# close the encoder's input and wait for it to write the file, FfmpegError if it failed
+def finish_ffmpeg_process(ffmpeg_process):
+    try:
+        ffmpeg_process.stdin.close()
+    except BrokenPipeError: # ffmpeg already exited, its stderr says why
+        pass
+    check_ffmpeg_process(ffmpeg_process, "encoding")
+
+# filter frames and send them to ffmpeg, returns number of frames written
+# controller -> DeadlineController that decides how each frame is filtered (None -> every frame at full quality)
+def encode_frames(frames, ffmpeg_process, filter_type, bg_color, session, pipelined=False, controller=None):
+    frame_count = 0
+    report = session.report
+
+    def filter_frame(frame, frame_idx):
+        if controller is not None:
+            return controller.filter_frame(frame, lambda f: filter_vid_frame(f, frame_idx, filter_type, bg_color, session))
+        return filter_vid_frame(frame, frame_idx, filter_type, bg_color, session)
+
+    def write_frame(processed_frame):
+        nonlocal frame_count
+        # send processed frame to ffmpeg compression (no copy)
+        with timed(report, "encode_write"):
+            ffmpeg_process.stdin.write(memoryview(np.ascontiguousarray(processed_frame, dtype=np.uint8)))
+        frame_count += 1
+
+    if pipelined:
+        # decode, filter and encode run concurrently (joined by bounded queues)
+        run_pipeline(frames, filter_frame, write_frame)
+    else:
+        for frame_idx, frame in frames:
+            write_frame(filter_frame(frame, frame_idx))
+    count(report, "frames", frame_count)
+    return frame_count
+
+# time segments filtered in num_workers processes, each with a fresh session warmed up on the SEGMENT_WARMUP_FRAMES before it,
+# so every segment refits the palette at its start: until its first retrain (retrains at the same frame fit the same
+# palette, see update_palette) colours can differ from a sequential run, pieces are also encoded separately
+def process_vid_parallel(vid_input_path, vid_output_path, filter_type, bg_color, w, h, output_fps,
+                         frame_interval, total_frames, num_workers, pipelined=False, report=None, preset=DEFAULT_PRESET):
+    # source frames that survive fps limiting (same schedule as read_vid_frames)
+    schedule = get_frame_schedule(total_frames, frame_interval)
+    seg_len = max(SEGMENT_MIN_FRAMES, -(-len(schedule) // num_workers))
+
+    pieces_dir = tempfile.mkdtemp(dir=os.path.dirname(vid_output_path) or None)
+    try:
+        futures = []
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            for seg_idx, seg_start in enumerate(range(0, len(schedule), seg_len)):
+                seg_end = seg_start + seg_len
+                warmup_start = max(0, seg_start - SEGMENT_WARMUP_FRAMES) # prime edge buffer + kmeans before the segment
+                read_from, next_frame_to_process = schedule[warmup_start]
+                write_from = schedule[seg_start][0]
+                read_to = schedule[seg_end][0] if seg_end < len(schedule) else None # last segment reads until the end
+                piece_path = os.path.join(pieces_dir, f"piece_{seg_idx:04d}{OUTPUT_VIDEO_EXT}")
+                futures.append(pool.submit(process_vid_segment, vid_input_path, piece_path, filter_type, bg_color,
+                                           w, h, output_fps, frame_interval, read_from, next_frame_to_process,
+                                           write_from, read_to, pipelined, report is not None, preset))
+            piece_paths = []
+            for future in futures:
+                piece_path, piece_report = future.result()
+                piece_paths.append(piece_path)
+                if report is not None:
+                    report.merge(piece_report)
+        if report is not None:
+            # segments re-read their warm up frames, so take drops from the schedule instead of the merged counts
+            report.set_count("frames_dropped", total_frames - len(schedule))
+
+        # join encoded pieces without re-encoding
+        with timed(report, "concat"):
+            concat_vids([p for p in piece_paths if p is not None], vid_output_path)
+    finally:
+        shutil.rmtree(pieces_dir, ignore_errors=True)
+
+# runs in a worker process, returns (path of encoded piece, JobReport or None)
+# piece path is None if the segment had no frames, report only filled when with_report
+def process_vid_segment(vid_input_path, piece_path, filter_type, bg_color, w, h, output_fps, frame_interval,
+                        read_from, next_frame_to_process, write_from, read_to, pipelined=False, with_report=False, preset=DEFAULT_PRESET):
+    # fresh filter state for each segment (workers are reused between segments)
+    report = JobReport() if with_report else None
+    session = FilterSession(VIDEO_BUFFER_POOL_SIZE, report, preset)
+
+    cv_cap = cv.VideoCapture(vid_input_path)
+    if read_from > 0:
+        cv_cap.set(cv.CAP_PROP_POS_FRAMES, read_from)
+    frames = read_vid_frames(cv_cap, w, h, frame_interval, read_from, next_frame_to_process, read_to, report)
+
+    try:
+        # warm up on the frames before the segment without writing them
+        for frame_idx, frame in frames:
+            if frame_idx >= write_from:
+                first_frame = (frame_idx, frame)
+                break
+            filter_vid_frame(frame, frame_idx, filter_type, bg_color, session)
+            count(report, "warmup_frames")
+        else:
+            return None, report
+
+        ffmpeg_process = start_ffmpeg_process(piece_path, w, h, output_fps)
+        try:
+            encode_frames(itertools.chain([first_frame], frames), ffmpeg_process, filter_type, bg_color, session, pipelined)
+        finally:
+            with timed(report, "encode_flush"):
+                finish_ffmpeg_process(ffmpeg_process)
+    finally:
+        cv_cap.release()
+    return piece_path, report
+
+# sequential process_vid that encodes fixed length pieces into a job dir under checkpoint_dir, after each piece a checkpoint
+# (pieces done + filter state from session.get_state) is saved, a job with the same input and settings that finds one
+# seeks past the finished pieces and continues with the saved state, so a retry redoes at most one piece
+# opencv decoding (needs frame accurate seeking), the job dir is removed once the pieces are joined
+def process_vid_checkpointed(vid_input_path, vid_output_path, filter_type, bg_color, cv_cap, w, h, output_fps,
+                             frame_interval, total_frames, checkpoint_dir, session, pipelined=False):
+    report = session.report
+    schedule = get_frame_schedule(total_frames, frame_interval)
+    seg_len = max(1, int(round(CHECKPOINT_SEGMENT_SECS * output_fps)))
+    num_segs = -(-len(schedule) // seg_len)
+    job_key = get_checkpoint_key(vid_input_path, filter_type, bg_color, session.preset_name, w, h, output_fps, seg_len)
+    job_dir = os.path.join(checkpoint_dir, job_key)
+    os.makedirs(job_dir, exist_ok=True)
+    piece_paths = [os.path.join(job_dir, f"piece_{seg_idx:04d}{OUTPUT_VIDEO_EXT}") for seg_idx in range(num_segs)]
+
+    checkpoint = load_checkpoint(job_dir)
+    segs_done = 0
+    if checkpoint is not None:
+        segs_done = checkpoint["segs_done"]
+        session.set_state(checkpoint["session"])
+        count(report, "segments_resumed", segs_done)
+        print(f"Resuming from segment {segs_done + 1}/{num_segs}")
+
+    if segs_done < num_segs:
+        read_from, next_frame_to_process = schedule[segs_done * seg_len]
+        if read_from > 0:
+            cv_cap.set(cv.CAP_PROP_POS_FRAMES, read_from)
+        frames = read_vid_frames(cv_cap, w, h, frame_interval, read_from, next_frame_to_process, report=report)
+    for seg_idx in range(segs_done, num_segs):
+        # last piece takes whatever is left (frame count from the container can be off)
+        seg_frames = frames if seg_idx == num_segs - 1 else itertools.islice(frames, seg_len)
+        ffmpeg_process = start_ffmpeg_process(piece_paths[seg_idx], w, h, output_fps)
+        try:
+            num_frames = encode_frames(seg_frames, ffmpeg_process, filter_type, bg_color, session, pipelined)
+        finally:
+            with timed(report, "encode_flush"):
+                finish_ffmpeg_process(ffmpeg_process)
+        if num_frames == 0: # video ended before the frame count said it would
+            os.remove(piece_paths[seg_idx])
+        with timed(report, "checkpoint"):
+            save_checkpoint(job_dir, {"segs_done": seg_idx + 1, "session": session.get_state()})
+
+    with timed(report, "concat"):
+        concat_vids([p for p in piece_paths if os.path.exists(p)], vid_output_path)
+    shutil.rmtree(job_dir, ignore_errors=True)
+
+# job dir name, changes when the input file or anything that changes the pieces changes
+def get_checkpoint_key(vid_input_path, filter_type, bg_color, preset, w, h, output_fps, seg_len):
+    input_stat = os.stat(vid_input_path)
+    job = (os.path.abspath(vid_input_path), input_stat.st_size, input_stat.st_mtime_ns, filter_type, bg_color, preset, w, h, output_fps, seg_len)
+    return hashlib.sha256(repr(job).encode()).hexdigest()[:32]
+
+# saved checkpoint dict or None (no checkpoint yet / unreadable -> start over)
+def load_checkpoint(job_dir):
+    try:
+        with open(os.path.join(job_dir, CHECKPOINT_FILE_NAME), "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+def save_checkpoint(job_dir, checkpoint):
+    path = os.path.join(job_dir, CHECKPOINT_FILE_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path) # atomic so a crash mid write leaves the previous checkpoint
+
+# (frame_idx, next_frame_to_process) for each source frame kept after fps limiting
+def get_frame_schedule(total_frames, frame_interval):
+    schedule = []
+    next_frame_to_process = 0.0
+    for frame_idx in range(total_frames):
+        if frame_idx >= next_frame_to_process:
+            schedule.append((frame_idx, next_frame_to_process))
+            next_frame_to_process += frame_interval
+    return schedule
+
+# lossless join of mp4s with identical encoding settings, the concat list is written next to the pieces
+def concat_vids(vid_paths, vid_output_path):
+    import ffmpeg # only loaded for video jobs
+    list_path = os.path.join(os.path.dirname(os.path.abspath(vid_paths[0])), "concat.txt")
+    with open(list_path, "w") as f:
+        for p in vid_paths:
+            escaped_path = os.path.abspath(p).replace("'", "'\\''") # concat demuxer quoting: ' -> '\''
+            f.write(f"file '{escaped_path}'\n")
+    try:
+        stream = ffmpeg.input(list_path, format="concat", safe=0).output(vid_output_path, c="copy").overwrite_output()
+        ffmpeg_process = tail_ffmpeg_stderr(stream.global_args("-loglevel", "error").run_async(pipe_stderr=True))
+        check_ffmpeg_process(ffmpeg_process, f"joining pieces into {vid_output_path}")
+    finally:
+        os.remove(list_path)
+
+def get_vid_dims(orig_w, orig_h, max_side=VIDEO_MAX_SIDE):
+    if max(orig_h, orig_w) > max_side:
+        scale = max_side / max(orig_h, orig_w)
         w = max(1, int(orig_w * scale))
         h = max(1, int(orig_h * scale))
         if w % 2 != 0:
@@ -44,12 +523,10 @@ def process_vid(vid_input_path, vid_output_dir, filter_type, bg_color=""):
     else:
         w = orig_w
         h = orig_h
+    return w, h
 
-    # build output file (force output ext to .mp4)
-    vid_output_path = get_output_path(vid_input_path, vid_output_dir, filter_type, bg_color)
-
-    print("Processing...")
-
+def start_ffmpeg_process(vid_output_path, w, h, output_fps, **output_kwargs):
+    import ffmpeg # only loaded for video jobs
     # ffmpeg input stream from raw frames
     ffmpeg_input = ffmpeg.input(
         'pipe:',
@@ -67,55 +544,139 @@ def process_vid(vid_input_path, vid_output_dir, filter_type, bg_color=""):
         crf=FFMPEG_CRF, # lower val -> higher quality -> uses more memory
         preset=FFMPEG_PRESET, # slower -> more efficient -> uses less memory (longer process time)
         pix_fmt=FFMPEG_PIX_FMT,
-        tune=FFMPEG_TUNE
+        tune=FFMPEG_TUNE,
+        **output_kwargs
     )
 
-    # start ffmpeg process async to receive raw frames
-    ffmpeg_process = ffmpeg_output.overwrite_output().run_async(pipe_stdin=True)
-
-
-    # read frames from input vivd with opencv
-    frame_idx = 0
-    processed_frame_idx = 0
-
-    frame_interval = input_fps / output_fps
-    next_frame_to_process = 0.0
+    ffmpeg_process = ffmpeg_output.overwrite_output().global_args("-loglevel", "error").run_async(pipe_stdin=True, pipe_stderr=True)
+    return tail_ffmpeg_stderr(ffmpeg_process)
 
+# read frames from input vid with opencv, dropping frames to match output fps
+def read_vid_frames(cv_cap, w, h, frame_interval, frame_idx=0, next_frame_to_process=0.0, end_frame=None, report=None):
     while cv_cap.isOpened():
-        ret, frame = cv_cap.read()
+        if end_frame is not None and frame_idx >= end_frame:
+            break
+        with timed(report, "decode"):
+            ret, frame = cv_cap.read()
         if not ret: 
             break
         
         if frame_idx >= next_frame_to_process:
-            if (w != orig_w or h != orig_h):
-                frame = cv.resize(frame, (w, h), interpolation=cv.INTER_AREA)
+            if (w != frame.shape[1] or h != frame.shape[0]):
+                with timed(report, "resize"):
+                    frame = cv.resize(frame, (w, h), interpolation=cv.INTER_AREA)
+            yield frame_idx, frame
+            next_frame_to_process += frame_interval
+        else:
+            count(report, "frames_dropped")
 
-            # apply filter to frame
-            if filter_type == "Sketch":
-                processed_frame = flt.get_sketch_frame(frame, bg_color, for_video=True)
-            else:
-                processed_frame = flt.get_cartoon_frame(frame, frame_idx, for_video=True)
+        frame_idx += 1
 
-            # send processed frame to ffmpeg compression
-            ffmpeg_process.stdin.write(processed_frame.astype('uint8').tobytes())
+# decode with ffmpeg, fps limiting and resizing happen in ffmpeg so only frames that get filtered reach python
+# (decode timing includes ffmpeg's resizing, dropped frames are estimated from total_frames)
+def read_vid_frames_ffmpeg(vid_input_path, w, h, input_fps, output_fps, report=None, total_frames=0):
+    import ffmpeg # only loaded for video jobs
+    stream = ffmpeg.input(vid_input_path)
+    if output_fps < input_fps:
+        stream = stream.filter("fps", fps=output_fps)
+    stream = stream.filter("scale", w, h, flags="area")
+    stream = stream.output("pipe:", format="rawvideo", pix_fmt="bgr24").global_args("-loglevel", "error")
+    ffmpeg_process = tail_ffmpeg_stderr(stream.run_async(pipe_stdout=True, pipe_stderr=True))
 
+    frame_interval = input_fps / output_fps
+    processed_frame_idx = 0
+    try:
+        while True:
+            frame = np.empty((h, w, 3), dtype=np.uint8)
+            with timed(report, "decode"):
+                frame_read = read_exact(ffmpeg_process.stdout, memoryview(frame).cast("B"))
+            if not frame_read:
+                break
+            yield int(processed_frame_idx * frame_interval), frame # index of matching source frame
             processed_frame_idx += 1
-            next_frame_to_process += frame_interval
+        # eof is also what a decode error looks like from here
+        check_ffmpeg_process(ffmpeg_process, f"decoding {vid_input_path}")
+        count(report, "frames_dropped", max(0, total_frames - processed_frame_idx))
+    finally:
+        ffmpeg_process.stdout.close()
+        if ffmpeg_process.poll() is None: # consumer stopped early
+            ffmpeg_process.kill()
+        ffmpeg_process.wait()
+        ffmpeg_process.stderr_thread.join()
 
-        frame_idx += 1
-    
-    cv_cap.release()
-    ffmpeg_process.stdin.close()
+# keep the last lines ffmpeg writes to stderr, read in a thread so ffmpeg never blocks on a full stderr pipe
+def tail_ffmpeg_stderr(ffmpeg_process):
+    ffmpeg_process.stderr_tail = deque(maxlen=FFMPEG_STDERR_TAIL_LINES)
+    def drain():
+        for line in ffmpeg_process.stderr:
+            ffmpeg_process.stderr_tail.append(line.decode(errors="replace").rstrip())
+        ffmpeg_process.stderr.close()
+    ffmpeg_process.stderr_thread = threading.Thread(target=drain, daemon=True)
+    ffmpeg_process.stderr_thread.start()
+    return ffmpeg_process
+
+# wait for ffmpeg to exit, FfmpegError with the end of its stderr if it exited with an error
+def check_ffmpeg_process(ffmpeg_process, action):
     ffmpeg_process.wait()
+    ffmpeg_process.stderr_thread.join()
+    if ffmpeg_process.returncode != 0:
+        stderr = "\n".join(ffmpeg_process.stderr_tail) or "(no output)"
+        raise FfmpegError(f"ffmpeg failed {action} (exit code {ffmpeg_process.returncode}):\n{stderr}")
 
-    est_time = get_time()
-    dl_log = f"VIDEO SAVED TO: {vid_output_path} AT: {est_time}"
-    print(dl_log)
+# fill buf from pipe, False if stream ended first
+def read_exact(pipe, buf):
+    filled = 0
+    while filled < len(buf):
+        num_read = pipe.readinto(buf[filled:])
+        if not num_read:
+            return False
+        filled += num_read
+    return True
 
-    #print("Video saved to ", vid_output_path)
-    flt.kmeans = None
-    fu.edge_buffer.clear()
-    return vid_output_path
+def filter_vid_frame(frame, frame_idx, filter_type, bg_color, session):
+    filter_start = time.perf_counter()
+    # apply filter to frame
+    if filter_type == "Sketch":
+        processed_frame = flt.get_sketch_frame(frame, bg_color, for_video=True, session=session)
+    else:
+        processed_frame = flt.get_cartoon_frame(frame, frame_idx, for_video=True, session=session)
+    if session.report is not None:
+        session.report.add_frame_latency(time.perf_counter() - filter_start)
+    return processed_frame
+
+# process_fn(output_dir) -> output_path, only run on a cache miss
+def run_cached(cache, input_path, output_dir, filter_type, bg_color, output_ext, process_fn, report=None, **key_params):
+    cache_key = cache.get_key(input_path, filter_type, bg_color, **key_params)
+    cached_path = get_cached_output(cache, cache_key, input_path, output_dir, filter_type, bg_color, output_ext, report)
+    if cached_path is not None:
+        return cached_path
+
+    if output_dir is not None:
+        output_path = process_fn(output_dir)
+        cache.put(cache_key, output_path)
+        return output_path
+
+    # no output dir -> write to cache scratch dir and move result into cache
+    tmp_dir = cache.make_tmp_dir()
+    try:
+        return cache.put(cache_key, process_fn(tmp_dir), move=True)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+# cached result (copied to output_dir if given) or None
+def get_cached_output(cache, cache_key, input_path, output_dir, filter_type, bg_color, output_ext, report=None):
+    cached_path = cache.get(cache_key, output_ext)
+    if cached_path is None:
+        return None
+    count(report, "cache_hits")
+    if report is not None:
+        report.finish()
+    if output_dir is not None:
+        output_path = get_output_path(input_path, output_dir, filter_type, bg_color)
+        shutil.copyfile(cached_path, output_path)
+        cached_path = output_path
+    print(f"LOADED FROM CACHE: {cached_path} AT: {get_time()}")
+    return cached_path
 
 def get_output_path(input_path, output_dir, filter_type, bg_color=""):
     filename = os.path.basename(input_path)
@@ -0,0 +1,142 @@
+import os
+import queue
+import shutil
+import tempfile
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2 as cv
+from mediafilter.constants import *
+from mediafilter.session import FilterSession, get_preset
+import mediafilter.filters as flt
+from mediafilter import process_media as pm
+
+class SchedulerBusy(Exception):
+    pass
+
+# one pool of worker processes + the estimated cost of the jobs it has accepted but not finished
+class Lane:
+    def __init__(self, name, num_workers, max_queued_cost):
+        self.name = name
+        self.num_workers = num_workers
+        self.max_queued_cost = max_queued_cost
+        self.queued_cost = 0.0
+        self.num_jobs = 0
+        self.pool = ProcessPoolExecutor(max_workers=num_workers, initializer=warm_worker)
+
+# runs filter jobs in warm worker processes, split into a light lane (images, short clips) and a heavy lane (long videos)
+# so a long video can't hold up quick jobs; jobs that would push a lane past its queued cost limit are rejected (SchedulerBusy)
+class JobScheduler:
+    def __init__(self, light_workers=SCHED_LIGHT_WORKERS, heavy_workers=SCHED_HEAVY_WORKERS, heavy_cost=SCHED_HEAVY_COST,
+                 light_max_queued_cost=SCHED_LIGHT_MAX_QUEUED_COST, heavy_max_queued_cost=SCHED_HEAVY_MAX_QUEUED_COST):
+        self.heavy_cost = heavy_cost
+        self.light = Lane("light", light_workers, light_max_queued_cost)
+        self.heavy = Lane("heavy", heavy_workers, heavy_max_queued_cost)
+        self.lock = threading.Lock()
+        self.manager = None # started on first streamed job (carries segment paths back from workers)
+
+        # start every worker now (one process per pending task) so the first requests don't pay for process start + warm up
+        for lane in [self.light, self.heavy]:
+            for start_future in [lane.pool.submit(os.getpid) for _ in range(lane.num_workers)]:
+                start_future.result()
+
+    # fn(input_path, output_dir, filter_type, bg_color, preset=preset, **kwargs) in a worker (pm.process_img / pm.process_vid), returns a Future
+    def submit(self, fn, input_path, output_dir, filter_type, bg_color="", preset=DEFAULT_PRESET, **kwargs):
+        lane, cost = self.admit(input_path, filter_type, preset, kwargs.get("full_res", False))
+        future = lane.pool.submit(fn, input_path, output_dir, filter_type, bg_color, preset=preset, **kwargs)
+        future.add_done_callback(lambda _: self.release(lane, cost))
+        return future
+
+    # like pm.process_vid_stream (yields segment paths, returns output path) but filtered in a worker
+    # the worker runs ahead of the consumer, so segments go to a dir owned by this generator that is only deleted once
+    # the consumer has asked for the item after the last segment (or stopped iterating)
+    def stream_vid(self, vid_input_path, vid_output_dir, filter_type, bg_color="", preset=DEFAULT_PRESET, **kwargs):
+        lane, cost = self.admit(vid_input_path, filter_type, preset)
+        with self.lock:
+            if self.manager is None:
+                self.manager = multiprocessing.Manager()
+        segment_queue = self.manager.Queue()
+        segments_dir = tempfile.mkdtemp(dir=vid_output_dir)
+        future = lane.pool.submit(run_vid_stream, segment_queue, vid_input_path, vid_output_dir, filter_type, bg_color, preset=preset,
+                                  segments_dir=segments_dir, **kwargs)
+        future.add_done_callback(lambda _: self.release(lane, cost))
+
+        try:
+            while True:
+                try:
+                    yield segment_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if future.done() and segment_queue.empty():
+                        break
+            return future.result()
+        finally:
+            if future.done():
+                shutil.rmtree(segments_dir, ignore_errors=True)
+            else: # consumer stopped early, worker may still be writing segments
+                future.add_done_callback(lambda _: shutil.rmtree(segments_dir, ignore_errors=True))
+
+    # pick lane for job and reserve its cost, raises SchedulerBusy if the lane is full
+    def admit(self, input_path, filter_type, preset=DEFAULT_PRESET, full_res=False):
+        cost = estimate_cost(input_path, filter_type, preset, full_res)
+        lane = self.heavy if cost >= self.heavy_cost else self.light
+        with self.lock:
+            # an idle lane always takes one job, even if it is bigger than the limit
+            if lane.num_jobs > 0 and lane.queued_cost + cost > lane.max_queued_cost:
+                raise SchedulerBusy(f"too many {lane.name} jobs queued, try again shortly")
+            lane.queued_cost += cost
+            lane.num_jobs += 1
+        return lane, cost
+
+    def release(self, lane, cost):
+        with self.lock:
+            lane.queued_cost -= cost
+            lane.num_jobs -= 1
+
+    def get_stats(self):
+        with self.lock:
+            return {lane.name: {"jobs": lane.num_jobs, "queued_cost": lane.queued_cost, "max_queued_cost": lane.max_queued_cost}
+                    for lane in [self.light, self.heavy]}
+
+    def shutdown(self):
+        for lane in [self.light, self.heavy]:
+            lane.pool.shutdown(cancel_futures=True)
+        if self.manager is not None:
+            self.manager.shutdown()
+
+# estimated work in megapixel-frames (after the preset's resizing) weighted by filter and preset
+def estimate_cost(input_path, filter_type, preset=DEFAULT_PRESET, full_res=False):
+    preset_values = get_preset(preset)
+    if os.path.splitext(input_path)[1].lower() in IMAGE_EXTENSIONS:
+        small = cv.imread(input_path, cv.IMREAD_REDUCED_GRAYSCALE_8) # only need the size, reduced decode is much cheaper
+        if small is None:
+            return 0.0
+        h, w = small.shape[0] * 8, small.shape[1] * 8
+        if not full_res:
+            scale = min(1.0, preset_values["image_max_side"] / max(h, w))
+            h, w = h * scale, w * scale
+        num_frames = 1
+        filter_weight = SCHED_IMAGE_WEIGHTS[filter_type]
+    else:
+        cv_cap, w, h, input_fps, output_fps, total_frames = pm.open_vid(input_path, preset_values["video_max_side"])
+        cv_cap.release()
+        num_frames = total_frames * output_fps / input_fps
+        filter_weight = SCHED_FILTER_WEIGHTS[filter_type]
+    return num_frames * w * h / 1e6 * filter_weight * SCHED_PRESET_WEIGHTS[preset]
+
+# worker initializer, sklearn/kneed/ffmpeg are imported lazily by the package so load them here,
+# filtering a tiny frame also fills the lookup table caches and loads sklearn's compiled code
+def warm_worker():
+    importlib.import_module("ffmpeg") # only needs to be in sys.modules before the first video job
+    warm_frame = np.random.default_rng(0).integers(0, 256, (WARM_FRAME_SIDE, WARM_FRAME_SIDE, 3), dtype=np.uint8)
+    flt.get_sketch_frame(warm_frame, "Black", session=FilterSession())
+    flt.get_cartoon_frame(warm_frame, 0, session=FilterSession())
+
+def run_vid_stream(segment_queue, vid_input_path, vid_output_dir, filter_type, bg_color="", **kwargs):
+    stream = pm.process_vid_stream(vid_input_path, vid_output_dir, filter_type, bg_color, **kwargs)
+    while True:
+        try:
+            segment_queue.put(next(stream))
+        except StopIteration as stream_end:
+            return stream_end.value
@@ -0,0 +1,81 @@
+import numpy as np
+from mediafilter.constants import *
+from mediafilter.filters_utils import EdgeSmoother
+from mediafilter.metrics import timed
+
+# per-job filter state (palette model + edge history + scratch buffers) so jobs in the same process don't share anything
+# buffer_pool_size > 0 -> frame sized arrays are reused between frames instead of allocated every frame,
+# output frames rotate through buffer_pool_size arrays (must cover every frame still waiting to be encoded)
+# report -> metrics.JobReport that stage timings are added to (None -> instrumentation off)
+# preset -> name of a PRESETS entry (speed/quality settings used by the filters)
+# seed -> seed of the session's own rng for palette pixel samples (no shared np.random state between jobs)
+class FilterSession:
+    def __init__(self, buffer_pool_size=0, report=None, preset=DEFAULT_PRESET, seed=KMEANS_SAMPLE_SEED):
+        self.kmeans = None
+        self.lut = None # colour lookup table built from kmeans centroids
+        self.palette_color_sig = None # scene colour signature when the palette was last fitted
+        self.scene_sig = None # running colour signature of the current scene
+        self.scene_cut_frames = 0 # consecutive frames that look like a new scene
+        self.cut_rollback = None # palette from before a retrain on a suspected cut, restored if the cut was a flash
+        self.frames_since_retrain = 0
+        self.frames_since_fit = 0
+        self.edge_stats = None # smoothed canny/blur stats from previous frame
+        self.edge_buffer = EdgeSmoother(EDGE_BUFFER_LEN)
+        self.block_ref = None # incremental cartoon: input pixels each block was last filtered from
+        self.block_quantized = None # incremental cartoon: quantized colours + raw edges reused for unchanged blocks
+        self.block_edges = None
+        self.palette_worker = None # executor for background palette fits (live mode), None -> fitted inline
+        self.palette_future = None
+        self.pending_palette_update = None # update held back while a background fit runs ("retrain" / "partial_fit")
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.buffer_pool_size = buffer_pool_size
+        self.buffers = {}
+        self.output_buffers = []
+        self.output_idx = 0
+        self.report = report
+        self.preset_name = preset
+        self.preset = get_preset(preset)
+
+    def reset(self):
+        self.__init__(self.buffer_pool_size, self.report, self.preset_name, self.seed)
+
+    # temporal filter state carried from one frame to the next (palette + edge history + incremental cartoon blocks + rng),
+    # picklable for checkpoints, a session restored with set_state filters the next frame exactly like this one would
+    def get_state(self):
+        return {"kmeans": self.kmeans, "lut": self.lut, "palette_color_sig": self.palette_color_sig, "scene_sig": self.scene_sig,
+                "scene_cut_frames": self.scene_cut_frames, "cut_rollback": self.cut_rollback, "frames_since_retrain": self.frames_since_retrain, "frames_since_fit": self.frames_since_fit,
+                "edge_stats": self.edge_stats, "edge_buffer": self.edge_buffer,
+                "block_ref": self.block_ref, "block_quantized": self.block_quantized, "block_edges": self.block_edges, "rng": self.rng}
+
+    def set_state(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    # with session.time("stage"): ... -> adds to report, no-op without one
+    def time(self, name):
+        return timed(self.report, name)
+
+    # scratch array reused every frame
+    def get_buffer(self, name, shape, dtype=np.uint8):
+        if self.buffer_pool_size == 0:
+            return np.empty(shape, dtype=dtype)
+        buf = self.buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buf
+        return buf
+
+    # array for a filtered frame, not reused until buffer_pool_size more frames have been filtered
+    def get_output_buffer(self, shape):
+        if self.buffer_pool_size == 0:
+            return np.empty(shape, dtype=np.uint8)
+        if len(self.output_buffers) == 0 or self.output_buffers[0].shape != shape:
+            self.output_buffers = [np.empty(shape, dtype=np.uint8) for _ in range(self.buffer_pool_size)]
+        self.output_idx = (self.output_idx + 1) % self.buffer_pool_size
+        return self.output_buffers[self.output_idx]
+
+def get_preset(name):
+    if name not in PRESETS:
+        raise ValueError(f"unknown preset {name!r}, expected one of {list(PRESETS)}")
+    return PRESETS[name]
@@ -0,0 +1,47 @@
+import os
+from benchmarks import synthetic
+from mediafilter import __main__ as batch
+
+def write_inputs(root):
+    for rel_path in ["a/x.png", "b/x.png", "b/y.png"]:
+        os.makedirs(os.path.dirname(os.path.join(root, rel_path)), exist_ok=True)
+        synthetic.write_image(os.path.join(root, rel_path), "shapes", 96, 64)
+
+def test_outputs_mirror_input_tree(tmp_path):
+    write_inputs(tmp_path / "in")
+    out_dir = tmp_path / "out"
+    assert batch.main([str(tmp_path / "in"), "-r", "-o", str(out_dir), "-f", "Sketch", "-j", "1"]) == 0
+    assert sorted(os.path.relpath(os.path.join(d, f), out_dir) for d, _, fs in os.walk(out_dir) for f in fs) == \
+        ["a/x_sketch_Black.png", "b/x_sketch_Black.png", "b/y_sketch_Black.png"]
+
+    # rerun skips everything that is done
+    assert batch.main([str(tmp_path / "in"), "-r", "-o", str(out_dir), "-f", "Sketch", "-j", "1"]) == 0
+    os.remove(out_dir / "b" / "y_sketch_Black.png")
+    jobs = []
+    for input_path, rel_dir in batch.get_input_paths([str(tmp_path / "in")], recursive=True).items():
+        if not batch.is_up_to_date(input_path, os.path.join(out_dir, rel_dir), "Sketch", "Black"):
+            jobs.append(os.path.relpath(input_path, tmp_path / "in"))
+    assert jobs == ["b/y.png"]
+
+def test_glob_relative_to_wildcard(tmp_path):
+    write_inputs(tmp_path / "in")
+    input_dirs = batch.get_input_paths([str(tmp_path / "in" / "*" / "x.png")])
+    assert sorted(input_dirs.values()) == ["a", "b"]
+
+# x.png and x.jpg would both become x_sketch_Black.png, neither is processed and the batch fails
+def test_output_collisions_fail_up_front(tmp_path):
+    write_inputs(tmp_path / "in")
+    synthetic.write_image(str(tmp_path / "in" / "a" / "x.jpg"), "noise", 96, 64)
+    out_dir = tmp_path / "out"
+    assert batch.main([str(tmp_path / "in"), "-r", "-o", str(out_dir), "-f", "Sketch", "-j", "1"]) == 1
+    assert not os.path.exists(out_dir / "a" / "x_sketch_Black.png")
+    assert os.path.exists(out_dir / "b" / "x_sketch_Black.png")
+
+# nothing is left in the output dir when a job fails part way
+def test_failed_job_leaves_no_output(tmp_path):
+    os.makedirs(tmp_path / "in")
+    with open(tmp_path / "in" / "broken.mp4", "wb") as f:
+        f.write(b"not a video")
+    out_dir = tmp_path / "out"
+    assert batch.main([str(tmp_path / "in"), "-o", str(out_dir), "-f", "Sketch", "-j", "1"]) == 1
+    assert os.listdir(out_dir) == []
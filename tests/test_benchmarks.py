@@ -0,0 +1,42 @@
+import json
+import numpy as np
+import cv2 as cv
+from benchmarks import synthetic, run_benchmarks
+
+# benchmark numbers are only comparable across runs if the media is the same every time
+def test_synthetic_media_is_deterministic():
+    for kind in synthetic.IMAGE_KINDS:
+        img = synthetic.get_image(kind, 160, 96)
+        assert img.shape == (96, 160, 3) and img.dtype == np.uint8
+        assert np.array_equal(img, synthetic.get_image(kind, 160, 96))
+    assert not np.array_equal(synthetic.get_image("shapes", 160, 96, seed=0), synthetic.get_image("shapes", 160, 96, seed=1))
+    frames = list(synthetic.get_video_frames(160, 96, 12, cut_every=5))
+    assert all(np.array_equal(a, b) for a, b in zip(frames, synthetic.get_video_frames(160, 96, 12, cut_every=5)))
+
+def test_media_set(tmp_path):
+    media = synthetic.write_media_set(str(tmp_path), resolutions=("360p",), video_frames=12)
+    w, h = synthetic.RESOLUTIONS["360p"]
+    for name, path in media.items():
+        if name.startswith("img_"):
+            assert cv.imread(path).shape == (h, w, 3), name
+        else:
+            cv_cap = cv.VideoCapture(path)
+            assert (cv_cap.get(cv.CAP_PROP_FRAME_WIDTH), cv_cap.get(cv.CAP_PROP_FRAME_HEIGHT)) == (w, h), name
+            assert cv_cap.get(cv.CAP_PROP_FRAME_COUNT) == 12, name
+            cv_cap.release()
+
+def test_get_regressions():
+    baseline = {"a": {"min_s": 1.0}, "b": {"min_s": 1.0}, "gone": {"min_s": 1.0}}
+    results = {"a": {"min_s": 1.1}, "b": {"min_s": 1.3}, "new": {"min_s": 5.0}}
+    assert run_benchmarks.get_regressions(results, baseline, 0.15) == [("b", 1.0, 1.3, 1.3)]
+
+# quick run writes a results json and fails against a baseline that is much faster
+def test_benchmarks_smoke(tmp_path):
+    results_path, baseline_path = str(tmp_path / "results.json"), str(tmp_path / "baseline.json")
+    with open(baseline_path, "w") as f:
+        json.dump({"results": {"filters_utils.get_frame_stats[img_shapes_360p]": {"min_s": 1e-9}}}, f)
+    assert run_benchmarks.main(["--quick", "--repeats", "1", "--skip-e2e", "-o", results_path, "--baseline", baseline_path]) == 1
+    with open(results_path) as f:
+        results = json.load(f)["results"]
+    assert "filters.get_cartoon_frame_video[img_shapes_360p]" in results
+    assert all(res["min_s"] > 0 for res in results.values())
@@ -0,0 +1,67 @@
+import os
+import shutil
+from benchmarks import synthetic
+import mediafilter.constants as constants
+from mediafilter import process_media as pm
+from mediafilter.cache import ResultCache
+from mediafilter.metrics import JobReport
+
+def write_file(path, num_bytes):
+    with open(path, "wb") as f:
+        f.write(b"x" * num_bytes)
+    return path
+
+def test_key_depends_on_content_and_settings(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache"))
+    img_path = synthetic.write_image(str(tmp_path / "a.png"), "shapes", 96, 64)
+    key = cache.get_key(img_path, "Sketch", "Black", preset="balanced")
+
+    # same content under another name -> same key, argument order doesn't matter
+    copy_path = str(tmp_path / "b.png")
+    shutil.copyfile(img_path, copy_path)
+    assert cache.get_key(copy_path, "Sketch", "Black", preset="balanced") == key
+    assert cache.get_key(img_path, "Sketch", "Black", full_res=False, preset="balanced") == \
+        cache.get_key(img_path, "Sketch", "Black", preset="balanced", full_res=False)
+
+    other_keys = [
+        cache.get_key(synthetic.write_image(str(tmp_path / "c.png"), "noise", 96, 64), "Sketch", "Black", preset="balanced"),
+        cache.get_key(img_path, "Cartoon", "", preset="balanced"),
+        cache.get_key(img_path, "Sketch", "White", preset="balanced"),
+        cache.get_key(img_path, "Sketch", "Black", preset="fast"),
+        cache.get_key(img_path, "Sketch", "Black", preset="balanced", full_res=True),
+    ]
+    monkeypatch.setattr(constants, "FFMPEG_CRF", constants.FFMPEG_CRF + 1)
+    other_keys.append(cache.get_key(img_path, "Sketch", "Black", preset="balanced"))
+    assert len(set(other_keys + [key])) == len(other_keys) + 1
+
+# entries are dropped least recently used first (get() counts as a use) until the cache fits max_bytes
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=250)
+    for age, key in enumerate(["a", "b"]):
+        os.utime(cache.put(key, write_file(str(tmp_path / f"{key}.png"), 100)), (1000 + age, 1000 + age))
+    assert cache.get("a", ".png") # a is now the most recently used
+    cache.put("c", write_file(str(tmp_path / "c.png"), 100)) # 300 bytes > 250
+    assert cache.get("b", ".png") is None
+    assert cache.get("a", ".png") and cache.get("c", ".png")
+
+# an entry bigger than max_bytes is still kept (it was just asked for), everything else goes
+def test_put_keeps_new_entry(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=150)
+    cache.put("small", write_file(str(tmp_path / "small.png"), 100))
+    src_path = write_file(str(tmp_path / "big.png"), 200)
+    path = cache.put("big", src_path, move=True)
+    assert os.path.getsize(path) == 200 and not os.path.exists(src_path)
+    assert cache.get("small", ".png") is None
+    assert [entry.name for entry in os.scandir(cache.cache_dir)] == ["big.png"] # no .tmp left behind
+
+def test_process_img_served_from_cache(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    img_path = synthetic.write_image(str(tmp_path / "in.png"), "shapes", 96, 64)
+    os.makedirs(tmp_path / "out1")
+    os.makedirs(tmp_path / "out2")
+    first_path = pm.process_img(img_path, str(tmp_path / "out1"), "Sketch", "Black", cache=cache)
+    report = JobReport()
+    second_path = pm.process_img(img_path, str(tmp_path / "out2"), "Sketch", "Black", cache=cache, report=report)
+    assert report.counters.get("cache_hits") == 1
+    with open(first_path, "rb") as a, open(second_path, "rb") as b:
+        assert a.read() == b.read()
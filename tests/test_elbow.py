@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from benchmarks import synthetic
+import mediafilter.filters_utils as fu
+from mediafilter.constants import PRESETS
+
+def get_sample(pix_colors, size=4000):
+    rng = np.random.default_rng(0)
+    return pix_colors[rng.choice(len(pix_colors), size=size, replace=False)]
+
+def get_k_elbow_both(monkeypatch, sample, k_min, k_max, step):
+    ks = []
+    for fast in [True, False]:
+        monkeypatch.setattr(fu, "KMEANS_ELBOW_FAST", fast)
+        ks.append(fu.get_k_elbow(sample, k_min, k_max, step, for_vid=False))
+    return ks
+
+# histogram + warm started lloyd's picks the same k as the MiniBatchKMeans sweep on the k bands the filters use
+@pytest.mark.parametrize("kind", synthetic.IMAGE_KINDS)
+def test_fast_elbow_matches_sweep(monkeypatch, kind):
+    img = synthetic.get_image(kind, 320, 180)
+    stats = fu.get_frame_stats(frame=img)
+    sample = get_sample(img.reshape(-1, 3))
+    for name, preset in PRESETS.items():
+        if preset["elbow"]:
+            fast_k, sweep_k = get_k_elbow_both(monkeypatch, sample, stats["k_min"], stats["k_max"], preset["k_step"])
+            assert fast_k == sweep_k, name
+
+# pixels from n distinct colours, the knee is at (or kneed's one before) n
+@pytest.mark.parametrize("n", [4, 6, 8])
+def test_fast_elbow_finds_planted_clusters(monkeypatch, n):
+    rng = np.random.default_rng(n)
+    colors = rng.integers(20, 235, (n, 3))
+    sample = np.clip(colors[rng.integers(0, n, 4000)] + rng.normal(0, 4, (4000, 3)), 0, 255).astype(np.uint8)
+    fast_k, sweep_k = get_k_elbow_both(monkeypatch, sample, 2, 16, 1)
+    assert n - 1 <= fast_k <= n
+    assert abs(fast_k - sweep_k) <= 1
+
+def test_elbow_inertias_decrease():
+    sample = get_sample(synthetic.get_image("shapes", 320, 180).reshape(-1, 3))
+    inertias = fu.get_elbow_inertias(sample, range(2, 21))
+    assert all(a >= b for a, b in zip(inertias, inertias[1:]))
+    assert inertias == fu.get_elbow_inertias(sample, range(2, 21)) # seeded, same sample -> same curve
@@ -0,0 +1,38 @@
+import os
+import numpy as np
+import pytest
+from benchmarks import synthetic
+from mediafilter import process_media as pm
+
+W, H = 160, 96
+
+@pytest.fixture
+def vid_path(tmp_path):
+    return synthetic.write_video(str(tmp_path / "in.mp4"), W, H, 24)
+
+def test_decoder_reads_all_frames(vid_path):
+    assert len(list(pm.read_vid_frames_ffmpeg(vid_path, W, H, 24.0, 24.0))) == 24
+
+# closing the generator early kills ffmpeg, that is not a decode error
+def test_decoder_stopped_early(vid_path):
+    frames = pm.read_vid_frames_ffmpeg(vid_path, W, H, 24.0, 24.0)
+    next(frames)
+    frames.close()
+
+# the moov atom is at the end, cutting the file in half leaves ffmpeg nothing to decode
+def test_decoder_error_raises_with_stderr(vid_path, tmp_path):
+    truncated_path = str(tmp_path / "truncated.mp4")
+    with open(vid_path, "rb") as f, open(truncated_path, "wb") as out:
+        out.write(f.read()[:os.path.getsize(vid_path) // 2])
+    with pytest.raises(pm.FfmpegError, match="moov atom not found"):
+        list(pm.read_vid_frames_ffmpeg(truncated_path, W, H, 24.0, 24.0))
+
+def test_encoder_error_raises_with_stderr(tmp_path):
+    ffmpeg_process = pm.start_ffmpeg_process(str(tmp_path / "missing" / "out.mp4"), W, H, 24.0)
+    try:
+        for _ in range(24):
+            ffmpeg_process.stdin.write(np.zeros((H, W, 3), dtype=np.uint8).tobytes())
+    except BrokenPipeError:
+        pass
+    with pytest.raises(pm.FfmpegError, match="No such file or directory"):
+        pm.finish_ffmpeg_process(ffmpeg_process)
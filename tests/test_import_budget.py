@@ -0,0 +1,13 @@
+import os
+import sys
+import subprocess
+from benchmarks import import_budget
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cold start imports stay under benchmarks.import_budget's default budget and don't load sklearn/kneed/ffmpeg
+def test_import_budget():
+    out = subprocess.run([sys.executable, "-m", "benchmarks.import_budget"], cwd=REPO_DIR, capture_output=True, text=True)
+    assert out.returncode == 0, out.stdout + out.stderr
+    lines = out.stdout.strip().splitlines()
+    assert len(lines) == len(import_budget.IMPORT_CHECKS) and all(line.endswith(" ok") for line in lines), out.stdout
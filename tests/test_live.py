@@ -0,0 +1,106 @@
+import time
+import numpy as np
+import cv2 as cv
+from concurrent.futures import Future
+from benchmarks import synthetic
+import mediafilter.filters as flt
+from mediafilter import live
+from mediafilter.session import FilterSession
+from mediafilter.metrics import JobReport
+
+# palette_worker whose fits only run when the test says so
+class ManualWorker:
+    def __init__(self):
+        self.queued = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.queued.append((future, fn, args))
+        return future
+
+    def run_all(self):
+        for future, fn, args in self.queued:
+            future.set_result(fn(*args))
+        self.queued = []
+
+def get_scene(kind):
+    return synthetic.get_image(kind, 160, 96) # static, only the cut changes the palette
+
+def get_quant_error(frame, session):
+    quantized = np.empty_like(frame)
+    flt.quantize_colors(frame, session, quantized)
+    return np.abs(quantized.astype(np.int16) - frame).mean()
+
+# a scene cut while a partial fit is running must still retrain once that fit is swapped in
+def test_scene_cut_during_background_fit_is_not_lost():
+    report = JobReport()
+    session = FilterSession(2, report, "fast")
+    worker = ManualWorker()
+    session.palette_worker = worker
+
+    frame_idx = 0
+    for _ in range(session.preset["partial_fit_interval"] + 1): # first palette is fitted inline, then a partial fit is submitted
+        flt.get_cartoon_frame(get_scene("shapes"), frame_idx, True, session)
+        frame_idx += 1
+    assert len(worker.queued) == 1 and report.counters["retrains"] == 1
+
+    for _ in range(3): # cut while the partial fit is still running
+        flt.get_cartoon_frame(get_scene("saturated"), frame_idx, True, session)
+        frame_idx += 1
+    assert session.pending_palette_update == "retrain"
+    assert len(worker.queued) == 1
+
+    worker.run_all()
+    flt.get_cartoon_frame(get_scene("saturated"), frame_idx, True, session) # swaps in the partial fit, submits the retrain
+    worker.run_all()
+    flt.get_cartoon_frame(get_scene("saturated"), frame_idx + 1, True, session)
+    assert report.counters["retrains"] == 2
+    assert session.pending_palette_update is None
+
+    fresh = FilterSession(0, None, "fast")
+    cut_frame = get_scene("saturated")
+    flt.get_cartoon_frame(cut_frame, 0, True, fresh)
+    assert get_quant_error(cut_frame, session) < get_quant_error(cut_frame, fresh) * 1.5
+
+# without a worker nothing is deferred, every update is fitted on the frame it was detected on
+def test_inline_palette_updates_unchanged():
+    session = FilterSession(2, JobReport(), "balanced")
+    for frame_idx, frame in enumerate(synthetic.get_video_frames(160, 96, 12, cut_every=6)):
+        flt.get_cartoon_frame(frame, frame_idx, True, session)
+        assert session.pending_palette_update is None
+    assert "palette_updates_deferred" not in session.report.counters
+
+def count_segment_frames(segment_paths):
+    num_frames = 0
+    for segment_path in segment_paths:
+        cv_cap = cv.VideoCapture(segment_path)
+        while cv_cap.read()[0]:
+            num_frames += 1
+        cv_cap.release()
+    return num_frames
+
+def run_file_playback(tmp_path, num_frames=48, fps=24):
+    vid_path = synthetic.write_video(str(tmp_path / "in.mp4"), 160, 96, num_frames, fps=fps)
+    sink = live.SegmentSink(str(tmp_path / "segments"), segment_secs=1.0)
+    report = live.run_live(live.FilePlaybackSource(vid_path), sink, "Sketch", "Black", preset="fast", max_latency=0.25)
+    return report, count_segment_frames(sink.segment_paths)
+
+# a file played back at real time pace is filtered frame for frame within the latency bound
+def test_run_live_file_playback(tmp_path):
+    report, num_output_frames = run_file_playback(tmp_path)
+    assert report.counters["frames"] == 48
+    assert report.counters["frames_dropped"] == 0
+    assert report.get_latency_percentiles()["p95"] < 0.25
+    assert num_output_frames == 48
+
+# a filter slower than the frame rate drops frames, the output repeats the newest filtered frame over them
+def test_run_live_slow_filter_drops_frames(tmp_path, monkeypatch):
+    get_sketch_frame = flt.get_sketch_frame
+    def slow_sketch_frame(*args, **kwargs):
+        time.sleep(0.1) # 2.4 frame intervals at 24 fps
+        return get_sketch_frame(*args, **kwargs)
+    monkeypatch.setattr(flt, "get_sketch_frame", slow_sketch_frame)
+    report, num_output_frames = run_file_playback(tmp_path)
+    assert report.counters["frames_dropped"] > 0
+    assert report.counters["frames"] + report.counters["frames_dropped"] == 48
+    assert num_output_frames == 48
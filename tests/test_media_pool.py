@@ -0,0 +1,121 @@
+import threading
+import pytest
+from benchmarks import synthetic
+from mediafilter import media_pool as mp
+
+def write_media(media_dir, num_images=5):
+    media_dir.mkdir()
+    for img_idx in range(num_images):
+        synthetic.write_image(str(media_dir / f"img_{img_idx}.png"), "shapes", 64, 48, seed=img_idx)
+    synthetic.write_video(str(media_dir / "clip.mp4"), 64, 48, 30, fps=30)
+    return str(media_dir)
+
+# fetch_page over a LocalProvider that counts the pages fetched
+class CountingFetch:
+    def __init__(self, provider):
+        self.provider = provider
+        self.num_calls = 0
+
+    def __call__(self, query, page):
+        self.num_calls += 1
+        return mp.get_photo_urls(self.provider, query, page, 10, "large")
+
+def wait_for_fetches(pool):
+    with pool.ready:
+        assert pool.ready.wait_for(lambda: pool.num_pending == 0, timeout=5)
+
+def test_local_provider_urls(tmp_path):
+    provider = mp.LocalProvider(write_media(tmp_path / "media"))
+    assert len(mp.get_photo_urls(provider, "q", 1, 10, "large")) == 5
+    assert len(mp.get_photo_urls(provider, "q", 1, 3, "original")) == 3
+    assert len(mp.get_video_urls(provider, "q", 1, 10, 0.5, 2, 64 * 48)) == 1
+    assert mp.get_video_urls(provider, "q", 1, 10, 2, 10, 64 * 48) == [] # 1s clip is too short
+    assert mp.get_video_urls(provider, "q", 1, 10, 0.5, 2, 1280 * 720) == []
+
+# pages are only fetched once the pool is down to refill_at urls
+def test_refill_at(tmp_path):
+    fetch = CountingFetch(mp.LocalProvider(write_media(tmp_path / "media")))
+    pool = mp.MediaPool(fetch, ["q"], max_page=3, max_size=20, refill_at=3)
+    try:
+        pool.get(timeout=5) # empty -> first fetch, 4 left
+        wait_for_fetches(pool)
+        assert fetch.num_calls == 1 and len(pool.urls) == 4
+        pool.get(timeout=5) # 3 left -> refill
+        wait_for_fetches(pool)
+        assert fetch.num_calls == 2 and len(pool.urls) == 8
+        pool.get(timeout=5)
+        wait_for_fetches(pool)
+        assert fetch.num_calls == 2
+    finally:
+        pool.shutdown()
+
+# oldest urls are dropped past max_size
+def test_max_size(tmp_path):
+    fetch = CountingFetch(mp.LocalProvider(write_media(tmp_path / "media")))
+    pool = mp.MediaPool(fetch, ["a", "b", "c"], max_page=3, max_size=7, refill_at=7)
+    try:
+        for _ in range(4):
+            pool.get(timeout=5)
+            wait_for_fetches(pool)
+            assert len(pool.urls) <= 7
+        assert fetch.num_calls > 3
+    finally:
+        pool.shutdown()
+
+# every url is handed out once, however many callers wait on the pool at the same time
+def test_concurrent_get():
+    lock = threading.Lock()
+    num_pages = 0
+    def fetch_page(query, page):
+        nonlocal num_pages
+        with lock:
+            num_pages += 1
+            page_idx = num_pages
+        return [f"{query}/{page_idx}/{url_idx}" for url_idx in range(4)]
+    pool = mp.MediaPool(fetch_page, ["a", "b"], max_page=3, max_size=1000, refill_at=2, num_fetchers=2)
+    urls, errors = [], []
+    def get_urls():
+        try:
+            for _ in range(10):
+                url = pool.get(timeout=5)
+                with lock:
+                    urls.append(url)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=get_urls) for _ in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        pool.shutdown()
+    assert errors == []
+    assert len(urls) == len(set(urls)) == 80
+
+def test_empty_provider(tmp_path):
+    (tmp_path / "empty").mkdir()
+    provider = mp.LocalProvider(str(tmp_path / "empty"))
+    pool = mp.MediaPool(lambda q, page: mp.get_photo_urls(provider, q, page, 10, "large"), ["q"], max_page=3)
+    try:
+        with pytest.raises(mp.MediaPoolEmpty, match="searches returned nothing usable"):
+            pool.get(timeout=5)
+    finally:
+        pool.shutdown()
+
+# a failing search is reported until a later one works
+def test_failing_provider():
+    fail = True
+    def fetch_page(query, page):
+        if fail:
+            raise ConnectionError("search timed out")
+        return []
+    pool = mp.MediaPool(fetch_page, ["q"], max_page=3)
+    try:
+        with pytest.raises(mp.MediaPoolEmpty, match="search timed out"):
+            pool.get(timeout=5)
+        fail = False
+        with pytest.raises(mp.MediaPoolEmpty, match="searches returned nothing usable"):
+            pool.get(timeout=5)
+    finally:
+        pool.shutdown()
@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import cv2 as cv
+import pytest
+from benchmarks import synthetic
+from mediafilter import process_media as pm
+from mediafilter.cache import ResultCache
+from mediafilter.metrics import JobReport
+
+def get_frame_count(vid_path):
+    cv_cap = cv.VideoCapture(vid_path)
+    num_frames = int(cv_cap.get(cv.CAP_PROP_FRAME_COUNT))
+    cv_cap.release()
+    return num_frames
+
+# pieces are joined through an ffmpeg concat list, quotes in the path must be escaped there
+@pytest.mark.parametrize("mode", ["parallel", "checkpointed"])
+def test_concat_path_with_quote(tmp_path, monkeypatch, mode):
+    monkeypatch.setattr(pm, "CHECKPOINT_SEGMENT_SECS", 0.5)
+    out_dir = tmp_path / "Bob's clips"
+    out_dir.mkdir()
+    vid_path = synthetic.write_video(str(out_dir / "it's.mp4"), 160, 96, 60)
+    kwargs = {"num_workers": 2} if mode == "parallel" else {"checkpoint_dir": str(out_dir / "checkpoints")}
+    output_path = pm.process_vid(vid_path, str(out_dir), "Sketch", "Black", **kwargs)
+    assert get_frame_count(output_path) == 48
+    assert not any(name.endswith(".txt") for name in os.listdir(out_dir))
+
+def test_concat_error_has_stderr(tmp_path):
+    piece_path = str(tmp_path / "piece.mp4")
+    with open(piece_path, "wb") as f:
+        f.write(b"not a video")
+    with pytest.raises(pm.FfmpegError, match="joining pieces"):
+        pm.concat_vids([piece_path], str(tmp_path / "out.mp4"))
+
+def read_frames(vid_path):
+    cv_cap = cv.VideoCapture(vid_path)
+    frames = []
+    while True:
+        ret, frame = cv_cap.read()
+        if not ret:
+            break
+        frames.append(frame.astype(np.int16))
+    cv_cap.release()
+    return frames
+
+# 120 output frames, 3 segments of 48 (SEGMENT_MIN_FRAMES) each starting with a fresh palette, cuts at output frames 48 and 96
+# documented tolerance (README): mean abs difference to the sequential output at most 1.5 over the clip and 8 on any frame
+@pytest.mark.parametrize("filter_type, bg_color, preset", [("Cartoon", "", "balanced"), ("Cartoon", "", "fast"), ("Sketch", "White", "balanced")])
+def test_parallel_matches_sequential(tmp_path, filter_type, bg_color, preset):
+    vid_path = synthetic.write_video(str(tmp_path / "in.mp4"), 320, 180, 150, cut_every=60)
+    outputs = []
+    for num_workers in [1, 3]:
+        output_dir = tmp_path / f"out_{num_workers}"
+        output_dir.mkdir()
+        outputs.append(read_frames(pm.process_vid(vid_path, str(output_dir), filter_type, bg_color, preset=preset, num_workers=num_workers)))
+    assert len(outputs[0]) == len(outputs[1]) == 120
+    diffs = [np.abs(a - b).mean() for a, b in zip(*outputs)]
+    assert np.mean(diffs) <= 1.5
+    assert max(diffs) <= 8, [(frame_idx, round(diff, 1)) for frame_idx, diff in enumerate(diffs) if diff > 8]
+
+def test_cache_key_includes_workers_and_decoder(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    vid_path = synthetic.write_video(str(tmp_path / "in.mp4"), 160, 96, 60)
+    report = JobReport()
+    pm.process_vid(vid_path, None, "Sketch", "Black", cache=cache, num_workers=2)
+    pm.process_vid(vid_path, None, "Sketch", "Black", cache=cache, report=report)
+    assert report.counters.get("cache_hits", 0) == 0
+    pm.process_vid(vid_path, None, "Sketch", "Black", cache=cache, report=report, decoder="ffmpeg")
+    assert report.counters.get("cache_hits", 0) == 0
+    pm.process_vid(vid_path, None, "Sketch", "Black", cache=cache, report=report, num_workers=2)
+    assert report.counters.get("cache_hits", 0) == 1
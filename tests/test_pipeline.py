@@ -0,0 +1,59 @@
+import time
+import random
+import pytest
+from benchmarks import synthetic
+from mediafilter import process_media as pm
+from mediafilter.pipeline import run_pipeline
+from mediafilter.session import FilterSession
+from mediafilter.constants import VIDEO_BUFFER_POOL_SIZE
+
+# stands in for the encoder process, keeps a copy of every frame written to stdin
+class FrameRecorder:
+    def __init__(self):
+        self.stdin = self
+        self.frames = []
+
+    def write(self, buf):
+        self.frames.append(bytes(buf))
+
+def test_pipeline_keeps_frame_order():
+    rng = random.Random(0)
+    def filter_frame(frame, frame_idx):
+        time.sleep(rng.random() * 0.002)
+        return (frame_idx, frame * 2)
+    written = []
+    def write_frame(item):
+        time.sleep(rng.random() * 0.002)
+        written.append(item)
+    run_pipeline(((i, i) for i in range(200)), filter_frame, write_frame, queue_size=2)
+    assert written == [(i, i * 2) for i in range(200)]
+
+@pytest.mark.parametrize("stage", ["decode", "filter", "write"])
+def test_pipeline_raises_stage_errors(stage):
+    def frames():
+        for i in range(100):
+            if stage == "decode" and i == 10:
+                raise RuntimeError(stage)
+            yield i, i
+    def filter_frame(frame, frame_idx):
+        if stage == "filter" and frame_idx == 10:
+            raise RuntimeError(stage)
+        return frame
+    def write_frame(frame):
+        if stage == "write" and frame == 10:
+            raise RuntimeError(stage)
+    with pytest.raises(RuntimeError, match=stage):
+        run_pipeline(frames(), filter_frame, write_frame, queue_size=2)
+
+# pipelined output is byte for byte the sequential output (processed frames come from a reused buffer pool,
+# so a frame overwritten before the encoder wrote it would show up here)
+@pytest.mark.parametrize("filter_type, bg_color, preset", [("Sketch", "White", "balanced"), ("Cartoon", "", "balanced"), ("Cartoon", "", "fast")])
+def test_pipelined_matches_sequential(filter_type, bg_color, preset):
+    outputs = []
+    for pipelined in [False, True]:
+        session = FilterSession(VIDEO_BUFFER_POOL_SIZE, None, preset)
+        recorder = FrameRecorder()
+        frames = enumerate(synthetic.get_video_frames(160, 96, 40, cut_every=15))
+        assert pm.encode_frames(frames, recorder, filter_type, bg_color, session, pipelined=pipelined) == 40
+        outputs.append(recorder.frames)
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,37 @@
+from benchmarks import synthetic
+import mediafilter.filters as flt
+import mediafilter.filters_utils as fu
+from mediafilter.constants import PRESETS, DEADLINE_LEVELS
+from mediafilter.session import FilterSession
+from mediafilter.metrics import JobReport
+from mediafilter.deadline import DeadlineController
+
+K_BANDS = [fu.get_k_range_from_stats(hue_var, avg_sat, unique_colors) for hue_var, avg_sat, unique_colors in
+           [(0, 0, 0), (100, 100, 10), (1000, 100, 100), (5000, 100, 100)]]
+
+# an elbow search needs at least 3 ks to find a knee in
+def test_elbow_presets_sweep_at_least_three_ks():
+    for name, preset in PRESETS.items():
+        if preset["elbow"]:
+            for k_min, k_max in K_BANDS:
+                assert len(range(k_min, k_max + 1, preset["k_step"])) >= 3, (name, k_min, k_max)
+
+def test_fixed_k_skips_elbow_search():
+    report = JobReport()
+    session = FilterSession(0, report, "fast")
+    img = synthetic.get_image("shapes", 320, 180)
+    flt.get_cartoon_frame(img, 0, for_video=True, session=session)
+    assert "elbow" not in report.stage_secs
+    k_max = fu.get_frame_stats(frame=img)["k_max"]
+    assert session.kmeans.n_clusters == k_max
+
+# lower deadline levels switch the elbow search off instead of stretching k_step past the band width
+def test_deadline_levels_keep_k_step():
+    for name in PRESETS:
+        session = FilterSession(0, None, name)
+        controller = DeadlineController(10.0, 100, session)
+        for level_idx, level in enumerate(DEADLINE_LEVELS):
+            controller.level_idx = level_idx
+            controller.apply_level()
+            assert session.preset["k_step"] == PRESETS[name]["k_step"]
+            assert session.preset["elbow"] == (PRESETS[name]["elbow"] and level["elbow"])
@@ -0,0 +1,60 @@
+import numpy as np
+from benchmarks import synthetic
+import mediafilter.filters as flt
+import mediafilter.filters_utils as fu
+from mediafilter.constants import PALETTE_DRIFT_THRESH, PRESETS
+from mediafilter.session import FilterSession
+from mediafilter.metrics import JobReport
+
+def run_cartoon(frames, preset="balanced"):
+    report = JobReport()
+    session = FilterSession(2, report, preset)
+    for frame_idx, frame in enumerate(frames):
+        flt.get_cartoon_frame(frame, frame_idx, for_video=True, session=session)
+    return report.counters
+
+def test_signature_stable_under_slow_pan():
+    for kind in synthetic.IMAGE_KINDS:
+        img = synthetic.get_image(kind, 640, 360)
+        sigs = [fu.get_color_signature(np.roll(img, frame_idx * 3, axis=1)) for frame_idx in range(8)]
+        assert max(fu.get_color_dist(a, b) for a, b in zip(sigs, sigs[1:])) < PALETTE_DRIFT_THRESH / 2, kind
+
+def test_saturated_pan_does_not_retrain():
+    img = synthetic.get_image("saturated", 320, 180)
+    counters = run_cartoon([np.roll(img, frame_idx * 3, axis=1) for frame_idx in range(30)])
+    assert counters["retrains"] == 1
+    assert counters.get("partial_fits", 0) <= 30 // PRESETS["balanced"]["partial_fit_interval"]
+
+def test_one_retrain_per_cut():
+    for preset in PRESETS:
+        counters = run_cartoon(synthetic.get_video_frames(320, 180, 36, cut_every=12), preset)
+        assert counters["retrains"] == 3, preset
+
+# a single different frame (flash) is quantized with a palette fitted on it, then the old scene's palette comes back
+def test_flash_rolls_back():
+    frames = list(synthetic.get_video_frames(320, 180, 12))
+    frames[6] = synthetic.get_image("saturated", 320, 180)
+    report = JobReport()
+    session = FilterSession(2, report, "balanced")
+    for frame_idx, frame in enumerate(frames):
+        flt.get_cartoon_frame(frame, frame_idx, for_video=True, session=session)
+        if frame_idx == 5:
+            scene_kmeans = session.kmeans
+        elif frame_idx == 6:
+            assert session.kmeans is not scene_kmeans
+    assert session.kmeans is scene_kmeans
+    assert report.counters["retrains"] == 2 and report.counters["cut_rollbacks"] == 1
+
+# the first frame of a new scene is quantized with a palette fitted on it, not the previous scene's
+def test_cut_frame_gets_new_palette():
+    frames = list(synthetic.get_video_frames(320, 180, 36, cut_every=12))
+    session = FilterSession(2, None, "balanced")
+    quant_errors = []
+    for frame_idx, frame in enumerate(frames):
+        flt.get_cartoon_frame(frame, frame_idx, for_video=True, session=session)
+        smooth = fu.smooth_colors(frame, session.preset["smooth_scale"])
+        quantized = np.empty_like(smooth)
+        flt.quantize_colors(smooth, session, quantized)
+        quant_errors.append(np.abs(quantized.astype(np.int16) - smooth).mean())
+    for cut_idx in [12, 24]:
+        assert quant_errors[cut_idx] <= 1.1 * np.mean(quant_errors[cut_idx + 1:cut_idx + 6]), (cut_idx, quant_errors)
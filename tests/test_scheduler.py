@@ -0,0 +1,40 @@
+import os
+import time
+import pytest
+from benchmarks import synthetic
+from mediafilter.scheduler import JobScheduler
+
+@pytest.fixture(scope="module")
+def scheduler():
+    scheduler = JobScheduler(light_workers=1, heavy_workers=1)
+    yield scheduler
+    scheduler.shutdown()
+
+# the worker finishes (and concatenates) long before this slow consumer reads the segments
+def test_stream_vid_segments_outlive_worker(scheduler, tmp_path):
+    vid_path = synthetic.write_video(str(tmp_path / "clip.mp4"), 160, 96, 30, fps=10)
+    stream = scheduler.stream_vid(vid_path, str(tmp_path), "Sketch", "Black", segment_secs=1.0)
+    segment_paths = []
+    while True:
+        try:
+            segment_path = next(stream)
+        except StopIteration as stream_end:
+            output_path = stream_end.value
+            break
+        time.sleep(0.5)
+        assert os.path.getsize(segment_path) > 0
+        segment_paths.append(segment_path)
+
+    assert len(segment_paths) == 3
+    assert os.path.exists(output_path)
+    assert not os.path.exists(os.path.dirname(segment_paths[0])) # cleaned up once the stream is done
+
+def test_stream_vid_cleans_up_when_consumer_stops(scheduler, tmp_path):
+    vid_path = synthetic.write_video(str(tmp_path / "clip.mp4"), 160, 96, 30, fps=10)
+    stream = scheduler.stream_vid(vid_path, str(tmp_path), "Sketch", "Black", segment_secs=1.0)
+    segments_dir = os.path.dirname(next(stream))
+    stream.close()
+    deadline = time.time() + 30
+    while os.path.exists(segments_dir) and time.time() < deadline:
+        time.sleep(0.1)
+    assert not os.path.exists(segments_dir)